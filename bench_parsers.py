@@ -0,0 +1,265 @@
+"""
+bench_parsers.py — офлайн-бенчмарк разбора ответов площадок.
+Запуск: python bench_parsers.py [-k фильтр] [--min-time 0.5] [--rounds 5] [--save-baseline]
+
+Все ответы берутся из fixtures/ (manifest.json: префикс URL → файл),
+сеть не нужна: на transport.session монтируется адаптер, который
+отдаёт записанные ответы. Для каждого случая — пропускная способность,
+перцентили времени и пик выделенной памяти (tracemalloc). Результат
+сравнивается с fixtures/baseline.json; медленнее или прожорливее
+базовой линии больше чем в --tolerance раз — код выхода 1.
+
+Случаи замеряются по кругу в несколько раундов (--rounds), итог —
+медиана раундов: если машину на время «придавило», это заденет
+один раунд всех случаев, а не все раунды одного случая.
+
+Времена в базовой линии — с той машины, где её записали, поэтому
+сравнение идёт с поправкой на скорость машины: медиана отношений
+«сейчас / базовая линия» по всем случаям прогона. Регрессия — случай,
+отставший от остальных, а не машина, которая целиком медленнее.
+Поправка считается, когда случаев не меньше MIN_CASES_FOR_SPEED
+(с узким -k — абсолютные мс). Равномерное замедление всех случаев
+так не видно — его покажет строка «машина ×…» или базовая линия,
+записанная заново на этой машине (--save-baseline).
+"""
+import sys, os, gzip, json, argparse, logging, statistics, tempfile, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from requests.adapters import BaseAdapter
+import config
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE = os.path.join(FIXTURES, "baseline.json")
+MIN_CASES_FOR_SPEED = 5
+
+G = "\033[92m"   # зелёный
+R = "\033[91m"   # красный
+B = "\033[1m"    # жирный
+X = "\033[0m"    # сброс
+
+# Учётные данные-заглушки: иначе checker не пойдёт в API.
+# БД — временная, чтобы не трогать курсоры и токены бота.
+config.TWITCH_CLIENT_ID = config.TWITCH_CLIENT_SECRET = "bench"
+config.YOUTUBE_API_KEY = "bench"
+config.HTTP_HEDGE_MIN_SAMPLES = 10 ** 9   # без дублирующих запросов
+
+import database as db
+db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+import checker as chk
+
+
+# ─── Записанные ответы ────────────────────────────────────────
+
+def load(name: str) -> str:
+    with gzip.open(os.path.join(FIXTURES, name), "rt", encoding="utf-8") as f:
+        return f.read()
+
+class FixtureAdapter(BaseAdapter):
+    """Отдаёт ответ из fixtures/ по самому длинному совпавшему префиксу URL."""
+
+    def __init__(self, manifest: dict[str, str]):
+        super().__init__()
+        self.routes = sorted(((url, load(name).encode("utf-8"), name)
+                              for url, name in manifest.items()),
+                             key=lambda r: -len(r[0]))
+
+    def send(self, request, **kwargs):
+        resp = requests.Response()
+        resp.request, resp.url = request, request.url
+        resp.status_code, resp._content = 404, b"{}"
+        for prefix, body, name in self.routes:
+            if request.url.startswith(prefix):
+                resp.status_code, resp._content = 200, body
+                resp.headers["Content-Type"] = (
+                    "application/json" if ".json" in name else "text/html; charset=utf-8")
+                break
+        resp.encoding = "utf-8"
+        return resp
+
+    def close(self):
+        pass
+
+def mount():
+    with open(os.path.join(FIXTURES, "manifest.json"), encoding="utf-8") as f:
+        adapter = FixtureAdapter(json.load(f))
+    chk.S.mount("https://", adapter)
+    chk.S.mount("http://", adapter)
+
+
+# ─── Случаи ───────────────────────────────────────────────────
+#
+# Случай — (имя, setup, run). setup не замеряется: сбрасывает кэш
+# страниц и курсоры лент, чтобы каждый прогон разбирал всё заново.
+
+def fresh():
+    chk.S.clear_cache()
+
+def fresh_feed(source: str):
+    def setup():
+        chk.S.clear_cache()
+        db.set_feed_cursor(source, 0, None)
+    return setup
+
+def parse_case(name: str, fn, fixture: str):
+    text = load(fixture)
+    return name, None, lambda: fn(text)
+
+def cases() -> list:
+    tg_live = load("telegram/channel_live.html.gz")
+    tg_texts = [text for _, _, text in chk._tg_new_posts(tg_live, chk._tg_post_ids(tg_live), 0)]
+    return [
+        # Чистый разбор уже скачанной страницы
+        parse_case("twitch._tw_html_live[live]",     chk._tw_html_live,     "twitch/channel_live.html.gz"),
+        parse_case("twitch._tw_html_live[offline]",  chk._tw_html_live,     "twitch/channel_offline.html.gz"),
+        parse_case("youtube._yt_html_live[live]",    chk._yt_html_live,     "youtube/channel_live.html.gz"),
+        parse_case("youtube._yt_html_live[offline]", chk._yt_html_live,     "youtube/channel_offline.html.gz"),
+        parse_case("kick._kick_html_live[live]",     chk._kick_html_live,   "kick/channel_live.html.gz"),
+        parse_case("kick._kick_timer[live]",         chk._kick_timer,       "kick/channel_live.html.gz"),
+        parse_case("kick._kick_timer[offline]",      chk._kick_timer,       "kick/channel_offline.html.gz"),
+        parse_case("vkplay._vkplay_html_live[live]", chk._vkplay_html_live, "vkplay/channel_live.html.gz"),
+        parse_case("vkplay._vkplay_timer[live]",     chk._vkplay_timer,     "vkplay/channel_live.html.gz"),
+        parse_case("telegram._tg_post_ids",          chk._tg_post_ids,      "telegram/channel_live.html.gz"),
+        (f"telegram._is_stream_post[x{len(tg_texts)}]", None,
+         lambda: [chk._is_stream_post(t) for t in tg_texts]),
+        # Через сессию: запрос к адаптеру + разбор
+        ("twitch.check_twitch[api]", fresh,
+         lambda: chk.check_twitch("https://www.twitch.tv/benchlive")),
+        ("youtube.check_youtube[api]", fresh,
+         lambda: chk.check_youtube("https://www.youtube.com/channel/UCbenchbenchbenchbench00")),
+        ("kick.check_kick[api live]", fresh,
+         lambda: chk.check_kick("https://kick.com/benchlive")),
+        ("kick.check_kick[api offline]", fresh,
+         lambda: chk.check_kick("https://kick.com/benchoffline")),
+        ("kick.get_duration_kick", fresh,
+         lambda: chk.get_duration_kick("https://kick.com/benchlive")),
+        ("vkplay.check_vkplay[api]", fresh,
+         lambda: chk.check_vkplay("https://live.vkvideo.ru/benchlive")),
+        ("vkplay.get_duration_vkplay", fresh,
+         lambda: chk.get_duration_vkplay("https://live.vkvideo.ru/benchlive")),
+        ("telegram.check_telegram[live]", fresh_feed("telegram:benchlive"),
+         lambda: chk.check_telegram("https://t.me/benchlive")),
+        ("telegram.check_telegram[offline]", fresh_feed("telegram:benchoffline"),
+         lambda: chk.check_telegram("https://t.me/benchoffline")),
+        ("vk_group.check_vk_group[live]", fresh_feed("vk_group:benchlive"),
+         lambda: chk.check_vk_group("https://vk.com/benchlive")),
+        ("vk_group.check_vk_group[offline]", fresh_feed("vk_group:benchoffline"),
+         lambda: chk.check_vk_group("https://vk.com/benchoffline")),
+    ]
+
+
+# ─── Замеры ───────────────────────────────────────────────────
+
+def measure(setup, run, min_time: float, min_runs: int, memory: bool = True) -> dict:
+    times = []
+    total = 0.0
+    while total < min_time or len(times) < min_runs:
+        if setup:
+            setup()
+        t = time.perf_counter()
+        run()
+        dt = time.perf_counter() - t
+        times.append(dt)
+        total += dt
+    # Память — отдельным прогоном: под tracemalloc время не показательно
+    peak = 0
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    q = statistics.quantiles(times, n=100, method="inclusive") if len(times) > 1 else times * 99
+    return {"runs": len(times),
+            "ops": len(times) / total,
+            "p50_ms": statistics.median(times) * 1000,
+            "p95_ms": q[94] * 1000,
+            "p99_ms": q[98] * 1000,
+            "peak_kib": peak / 1024}
+
+def combine(rounds: list[dict]) -> dict:
+    """Раунды одного случая → медиана по раундам (память — из первого)."""
+    result = {key: statistics.median(r[key] for r in rounds)
+              for key in ("ops", "p50_ms", "p95_ms", "p99_ms")}
+    result["runs"] = sum(r["runs"] for r in rounds)
+    result["peak_kib"] = rounds[0]["peak_kib"]
+    return result
+
+def machine_speed(results: dict, baseline: dict) -> float | None:
+    """Во сколько раз эта машина медленнее машины базовой линии (медиана по случаям)."""
+    ratios = [res["p50_ms"] / baseline[name]["p50_ms"] for name, res in results.items()
+              if baseline.get(name, {}).get("p50_ms")]
+    return statistics.median(ratios) if len(ratios) >= MIN_CASES_FOR_SPEED else None
+
+def compare(name: str, res: dict, base: dict | None, tolerance: float,
+            speed: float = 1.0) -> str:
+    if not base:
+        return ""
+    # Память от скорости машины не зависит
+    expected = {"p50_ms": base.get("p50_ms", 0) * speed, "peak_kib": base.get("peak_kib", 0)}
+    worse = []
+    for key in ("p50_ms", "peak_kib"):
+        if expected[key] and res[key] > expected[key] * tolerance:
+            worse.append(f"{key} ×{res[key] / expected[key]:.2f}")
+    if worse:
+        return f"{R}РЕГРЕССИЯ {', '.join(worse)}{X}"
+    return f"{G}×{res['p50_ms'] / expected['p50_ms']:.2f}{X}" if expected["p50_ms"] else ""
+
+
+def run():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("-k", dest="filter", default="", help="только случаи с этой подстрокой")
+    ap.add_argument("--min-time", type=float, default=0.5, help="секунд на случай (минимум)")
+    ap.add_argument("--min-runs", type=int, default=5)
+    ap.add_argument("--rounds", type=int, default=5,
+                    help="замеров каждого случая по кругу; --min-time делится между ними")
+    ap.add_argument("--tolerance", type=float, default=1.5,
+                    help="во сколько раз хуже базовой линии — уже регрессия")
+    ap.add_argument("--save-baseline", action="store_true",
+                    help="записать результаты в fixtures/baseline.json")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    db.init()
+    mount()
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    selected = [case for case in cases() if args.filter in case[0]]
+    rounds: dict[str, list[dict]] = {name: [] for name, _, _ in selected}
+    for i in range(max(1, args.rounds)):
+        for name, setup, fn in selected:
+            rounds[name].append(measure(setup, fn, args.min_time / max(1, args.rounds),
+                                        args.min_runs, memory=i == 0))
+    results = {name: combine(r) for name, r in rounds.items()}
+
+    speed = machine_speed(results, baseline)
+    if speed is not None:
+        print(f"Машина ×{speed:.2f} от машины базовой линии (медиана по случаям)\n")
+    elif baseline:
+        print(f"Случаев меньше {MIN_CASES_FOR_SPEED} — сравнение в абсолютных мс\n")
+    print(f"{B}{'случай':<36} {'оп/с':>9} {'p50 мс':>8} {'p95 мс':>8} "
+          f"{'p99 мс':>8} {'пик КиБ':>9}{X}")
+    regressions = 0
+    for name, res in results.items():
+        note = compare(name, res, baseline.get(name), args.tolerance, speed or 1.0)
+        regressions += "РЕГРЕССИЯ" in note
+        print(f"{name:<36} {res['ops']:>9.0f} {res['p50_ms']:>8.3f} {res['p95_ms']:>8.3f} "
+              f"{res['p99_ms']:>8.3f} {res['peak_kib']:>9.0f}  {note}")
+
+    if args.save_baseline:
+        baseline.update({name: {k: round(res[k], 4) for k in ("p50_ms", "p95_ms", "peak_kib")}
+                         for name, res in results.items()})
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nБазовая линия сохранена: {BASELINE}")
+    if regressions:
+        print(f"\n{R}{B}Регрессий: {regressions}{X}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run()
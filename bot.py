@@ -9,13 +9,15 @@ bot.py — главный файл. Запускать: python bot.py
   • Не падает если пользователь заблокировал бота
   • Админ-команды для мониторинга
 """
-import logging, threading, time, json, signal, sys
+import logging, threading, time, json, queue, signal, sys
+from collections import OrderedDict
 import vk_api
-from vk_api.longpoll import VkLongPoll, VkEventType
+from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 from vk_api.exceptions import ApiError
 
-import config, database as db, checker as chk
+import config, database as db, checker as chk, transport, breaker, metrics, profiler, registry
+from scheduler import Scheduler
 
 # ─── Логирование ──────────────────────────────────────────────
 
@@ -30,21 +32,76 @@ log = logging.getLogger("bot")
 
 # ─── VK сессия ────────────────────────────────────────────────
 
-vk_session = vk_api.VkApi(token=config.VK_TOKEN)
-vk = vk_session.get_api()
+# VkApi.method выполняет вызовы по одному под своим lock и ещё держит
+# паузу RPS_DELAY (~3 вызова/с) — поэтому у каждого потока свой VkApi
+# без паузы, а лимит VK соблюдает _send_limit (общий на все потоки).
+# Ответы пользователям не ждут потоки доставки, и наоборот.
+
+def _new_session() -> vk_api.VkApi:
+    # peer_ids в messages.send и формат Bots Long Poll требуют свежей версии API
+    session = vk_api.VkApi(token=config.VK_TOKEN, session=transport.vk_session(),
+                           api_version="5.199")
+    session.RPS_DELAY = 0
+    return session
+
+vk_session = _new_session()     # Long Poll
+_vk_local = threading.local()
+
+def _vk():
+    """VK API текущего потока."""
+    api = getattr(_vk_local, "api", None)
+    if api is None:
+        api = _vk_local.api = _new_session().get_api()
+    return api
 
 # Платформы, которые шлют уведомления (TG и ВК — только вспомогательные)
 NOTIFY_PLATFORMS = {"twitch", "youtube", "kick", "vkplay"}
 
 
+# ─── Метрики ──────────────────────────────────────────────────
+
+SEND_SECONDS = metrics.Histogram("vk_send_seconds", "Время вызова messages.send", ("mode",))
+DELIVERIES = metrics.Counter("vk_deliveries_total", "Сообщения по результату", ("result",))
+CYCLE_SECONDS = metrics.Histogram("check_cycle_seconds", "Время цикла _do_checks с проверками")
+LONGPOLL_EVENTS = metrics.Counter("longpoll_events_total", "События Long Poll", ("type",))
+HANDLE_SECONDS = metrics.Histogram("longpoll_handle_seconds", "Время обработки сообщения")
+
+metrics.Gauge("check_interval_seconds", "CHECK_INTERVAL_SECONDS — с ним сравнивать цикл",
+              fn=lambda: config.CHECK_INTERVAL_SECONDS)
+metrics.Gauge("outbox_pending", "Получатели в очереди на отправку", fn=lambda: db.outbox_pending())
+metrics.Gauge("breaker_open", "Предохранитель площадки разомкнут (1) или нет", ("name",),
+              fn=lambda: {(name,): int(state != breaker.CLOSED)
+                          for name, (state, _) in breaker.snapshot().items()})
+
+
 # ─── Отправка сообщений ───────────────────────────────────────
 
+class _RateLimiter:
+    """Общий на все потоки лимит вызовов messages.send (VK: 20/сек)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+_send_limit = _RateLimiter(config.VK_SEND_RPS)
+
+
 def send(user_id: int, text: str, keyboard: str | None = None) -> bool:
     """
     Отправить сообщение пользователю.
     Если пользователь заблокировал бота — помечаем и пропускаем.
     Возвращает True при успехе.
     """
+    _send_limit.acquire()
     try:
         params = dict(
             user_id=user_id,
@@ -53,7 +110,9 @@ def send(user_id: int, text: str, keyboard: str | None = None) -> bool:
         )
         if keyboard:
             params["keyboard"] = keyboard
-        vk.messages.send(**params)
+        with SEND_SECONDS.time("single"):
+            _vk().messages.send(**params)
+        DELIVERIES.inc("delivered")
         return True
     except ApiError as e:
         code = e.code if hasattr(e, "code") else 0
@@ -61,39 +120,204 @@ def send(user_id: int, text: str, keyboard: str | None = None) -> bool:
             # Пользователь заблокировал бота или запретил сообщения
             log.warning("User %s blocked bot, marking", user_id)
             db.mark_blocked(user_id)
+            DELIVERIES.inc("blocked")
         else:
             log.error("send %s (ApiError %s): %s", user_id, code, e)
+            DELIVERIES.inc("failed")
     except Exception as e:
         log.error("send %s: %s", user_id, e)
+        DELIVERIES.inc("failed")
     return False
 
-def send_many(user_ids: list[int], text: str):
-    """Разослать сообщение списку пользователей с паузой (анти-флуд VK)."""
-    for i, uid in enumerate(user_ids):
-        send(uid, text)
-        if i > 0 and i % 20 == 0:
-            time.sleep(1)  # VK: не более 20 сообщений/сек
+BULK_PEERS = 100   # messages.send принимает до 100 peer_ids
+
+def _send_peers(user_ids: list[int], text: str,
+                random_id: int) -> tuple[list[int], list[int], list[int]] | None:
+    """
+    Одно сообщение до 100 получателям за один вызов messages.send.
+    Возвращает (доставлено, заблокировали бота 901/902, ошибка) или
+    None, если не прошёл сам вызов (сеть, ошибка API) — получатели
+    тут ни при чём.
+    """
+    _send_limit.acquire()
+    try:
+        with SEND_SECONDS.time("bulk"):
+            results = _vk().messages.send(
+                peer_ids=",".join(map(str, user_ids)),
+                message=text,
+                random_id=random_id,
+            )
+    except Exception as e:
+        log.error("send_peers %d users: %s", len(user_ids), e)
+        DELIVERIES.inc("failed", n=len(user_ids))
+        return None
+    delivered, blocked, failed = [], [], []
+    for item in results:
+        error = item.get("error")
+        if not error:
+            delivered.append(item["peer_id"])
+        elif error.get("code") in (901, 902):
+            blocked.append(item["peer_id"])
+        else:
+            log.warning("send_peers %s: %s", item.get("peer_id"), error)
+            failed.append(item["peer_id"])
+    for result, ids in (("delivered", delivered), ("blocked", blocked), ("failed", failed)):
+        if ids:
+            DELIVERIES.inc(result, n=len(ids))
+    return delivered, blocked, failed
+
+
+# ─── Очередь уведомлений ──────────────────────────────────────
+#
+# Рассылки не отправляются из потока проверки: _notify_live и
+# /broadcast кладут их в таблицу outbox, а пул потоков доставки
+# разбирает её пачками по 100 под общим лимитом VK. После перезапуска
+# недоставленное досылается. random_id постоянен для события, а VK
+# сверяет его для каждого получателя отдельно — повторная отправка
+# той же пачки не даст дублей.
+
+_outbox_wake = threading.Event()
+
+# Сбои вызова messages.send подряд (по всем потокам доставки): пауза
+# перед повтором пачки растёт, пока VK не ответит
+_call_failures = 0
+_call_failures_lock = threading.Lock()
+
+def _call_failed() -> float:
+    """Учесть сбой вызова; пауза перед повтором, сек."""
+    global _call_failures
+    with _call_failures_lock:
+        _call_failures += 1
+        n = _call_failures
+    return min(config.OUTBOX_RETRY_SECONDS * 2 ** (n - 1), config.OUTBOX_RETRY_MAX_SECONDS)
+
+def _call_ok():
+    global _call_failures
+    with _call_failures_lock:
+        _call_failures = 0
+
+def enqueue(event: str, user_ids: list[int], text: str):
+    if not user_ids:
+        return
+    db.outbox_enqueue(event, text, user_ids)
+    _outbox_wake.set()
+
+def delivery_loop():
+    while True:
+        try:
+            batch = db.outbox_claim(BULK_PEERS, config.MAX_LATE_NOTIFY_MIN * 60)
+            if batch is None:
+                _outbox_wake.wait(5)
+                _outbox_wake.clear()
+                continue
+            event, text, random_id, user_ids = batch
+        except Exception as e:
+            log.error("delivery_loop: %s", e)
+            time.sleep(5)
+            continue
+        try:
+            _deliver(event, text, random_id, user_ids)
+        except Exception as e:
+            # Пачка уже помечена SENDING — вернуть её в очередь, иначе
+            # она пролежит до перезапуска (outbox_resume)
+            log.error("delivery_loop %s: %s", event, e)
+            try:
+                db.outbox_defer(event, user_ids, _call_failed())
+            except Exception as e:
+                log.error("delivery_loop defer %s: %s", event, e)
+                time.sleep(5)
+
+def _deliver(event: str, text: str, random_id: int, user_ids: list[int]):
+    result = _send_peers(user_ids, text, random_id)
+    if result is None:
+        # Сбой всего вызова — попытка получателям не засчитывается
+        db.outbox_defer(event, user_ids, _call_failed())
+        return
+    _call_ok()
+    delivered, blocked, failed = result
+    if blocked:
+        log.warning("%d users blocked bot, marking", len(blocked))
+        db.mark_blocked_many(blocked)
+    # Получатели без ответа VK — как ошибка, уйдут на повтор
+    answered = set(delivered) | set(blocked) | set(failed)
+    failed += [uid for uid in user_ids if uid not in answered]
+    db.outbox_finish(event, delivered + blocked, failed,
+                     config.OUTBOX_MAX_ATTEMPTS,
+                     config.OUTBOX_RETRY_SECONDS, config.OUTBOX_RETRY_MAX_SECONDS)
 
 
 # ─── Клавиатура ───────────────────────────────────────────────
 
-def build_keyboard(user_id: int) -> str:
+# Обычная клавиатура VK — не больше 10 рядов. Один ряд на стримера,
+# последний ряд — общие кнопки; при пагинации ещё ряд ◀ ▶.
+KB_MAX_ROWS  = 10
+KB_PAGE_SIZE = KB_MAX_ROWS - 2
+KB_CACHE_SIZE = 1024
+
+# Готовый JSON клавиатуры по (версия списка стримеров, страница,
+# битовая маска подписок на ней). Версия в ключе: клавиатура, собранная
+# по старому снимку уже после сброса, под новой версией не найдётся.
+_kb_cache: OrderedDict[tuple[int, int, int], str] = OrderedDict()
+_kb_lock = threading.Lock()
+
+def _kb_reset(snap):
+    with _kb_lock:
+        _kb_cache.clear()
+
+registry.on_change(_kb_reset)
+
+def _kb_page_size(total: int) -> int:
+    return total if total <= KB_MAX_ROWS - 1 else KB_PAGE_SIZE
+
+def _render_keyboard(chunk: list[dict], mask: int, page: int, pages: int) -> str:
     kb = VkKeyboard(one_time=False, inline=False)
-    for streamer in config.STREAMERS:
-        subscribed = db.is_subscribed(user_id, streamer["id"])
+    for i, streamer in enumerate(chunk):
+        subscribed = bool(mask >> i & 1)
         label = f"{'✅' if subscribed else '➕'} {streamer['name']}"
         kb.add_button(
             label,
             color=VkKeyboardColor.POSITIVE if subscribed else VkKeyboardColor.SECONDARY,
-            payload=json.dumps({"cmd": "toggle", "sid": streamer["id"]})
+            payload=json.dumps({"cmd": "toggle", "sid": streamer["id"], "p": page})
         )
         kb.add_line()
+    if pages > 1:
+        if page > 0:
+            kb.add_button("◀", payload=json.dumps({"cmd": "page", "p": page - 1}))
+        kb.add_button(f"{page + 1}/{pages}", payload=json.dumps({"cmd": "page", "p": page}))
+        if page < pages - 1:
+            kb.add_button("▶", payload=json.dumps({"cmd": "page", "p": page + 1}))
+        kb.add_line()
     kb.add_button("📋 Мои подписки", color=VkKeyboardColor.PRIMARY,
                   payload=json.dumps({"cmd": "mysubs"}))
     kb.add_button("❌ Отписаться от всех", color=VkKeyboardColor.NEGATIVE,
                   payload=json.dumps({"cmd": "unsub_all"}))
     return kb.get_keyboard()
 
+def build_keyboard(user_id: int, page: int = 0) -> str:
+    reg = registry.current()
+    streamers = reg.streamers
+    size = _kb_page_size(len(streamers)) or 1
+    pages = max(1, -(-len(streamers) // size))
+    page = max(0, min(page, pages - 1))
+    chunk = streamers[page * size:(page + 1) * size]
+
+    # Подписки пользователя — одним запросом, а не по запросу на стримера
+    subs = set(db.get_user_subscriptions(user_id))
+    mask = sum(1 << i for i, s in enumerate(chunk) if s["id"] in subs)
+
+    key = (reg.version, page, mask)
+    with _kb_lock:
+        keyboard = _kb_cache.get(key)
+        if keyboard is not None:
+            _kb_cache.move_to_end(key)
+            return keyboard
+    keyboard = _render_keyboard(chunk, mask, page, pages)
+    with _kb_lock:
+        _kb_cache[key] = keyboard
+        if len(_kb_cache) > KB_CACHE_SIZE:
+            _kb_cache.popitem(last=False)
+    return keyboard
+
 
 # ─── Обработка сообщений ──────────────────────────────────────
 
@@ -105,7 +329,7 @@ def handle(user_id: int, text: str, payload: dict | None):
     # ── Кнопка: переключить подписку ──
     if payload and payload.get("cmd") == "toggle":
         sid = payload["sid"]
-        streamer = next((s for s in config.STREAMERS if s["id"] == sid), None)
+        streamer = registry.get(sid)
         if not streamer:
             return
         if db.is_subscribed(user_id, sid):
@@ -114,7 +338,14 @@ def handle(user_id: int, text: str, payload: dict | None):
         else:
             db.subscribe(user_id, sid)
             msg = config.MSG_SUBSCRIBED.format(name=streamer["name"])
-        send(user_id, msg, keyboard=build_keyboard(user_id))
+        send(user_id, msg, keyboard=build_keyboard(user_id, payload.get("p", 0)))
+        return
+
+    # ── Кнопка: страница списка стримеров ──
+    if payload and payload.get("cmd") == "page":
+        page = int(payload.get("p", 0))
+        send(user_id, f"Стримеры — страница {page + 1}",
+             keyboard=build_keyboard(user_id, page))
         return
 
     # ── Кнопка: мои подписки ──
@@ -123,7 +354,10 @@ def handle(user_id: int, text: str, payload: dict | None):
         if not subs:
             send(user_id, config.MSG_NO_SUBS, keyboard=build_keyboard(user_id))
         else:
-            names = [s["name"] for s in config.STREAMERS if s["id"] in subs]
+            reg = registry.current()
+            names = [reg.by_id[sid]["name"]
+                     for sid in sorted((sid for sid in subs if sid in reg.by_id),
+                                       key=reg.position.__getitem__)]
             send(user_id,
                  "📋 Твои подписки:\n" + "\n".join(f"• {n}" for n in names),
                  keyboard=build_keyboard(user_id))
@@ -148,6 +382,18 @@ def handle(user_id: int, text: str, payload: dict | None):
         if text_lower == "/streamers":
             _cmd_streamers(user_id)
             return
+        if text_lower == "/latency":
+            _cmd_latency(user_id)
+            return
+        if text_lower == "/metrics":
+            _cmd_metrics(user_id)
+            return
+        if text_lower == "/profile" or text_lower.startswith("/profile "):
+            _cmd_profile(user_id, text_lower[len("/profile"):].strip())
+            return
+        if text_lower.split(" ", 1)[0] in ("/add", "/set", "/del", "/reload"):
+            _cmd_registry(user_id, text.strip())
+            return
         if text_lower.startswith("/broadcast "):
             msg = text.strip()[len("/broadcast "):]
             _cmd_broadcast(user_id, msg)
@@ -167,71 +413,288 @@ def _cmd_stats(admin_id: int):
     by_streamer = db.get_subscribers_count_by_streamer()
     lines = [f"📊 Статистика бота\n",
              f"Всего уникальных подписчиков: {total}\n"]
+    reg = registry.current()
     for row in by_streamer:
-        name = next((s["name"] for s in config.STREAMERS
-                     if s["id"] == row["streamer_id"]), row["streamer_id"])
+        streamer = reg.by_id.get(row["streamer_id"])
+        name = streamer["name"] if streamer else row["streamer_id"]
         lines.append(f"• {name}: {row['count']} чел.")
+    lines.append(f"\nВ очереди на отправку: {db.outbox_pending()}")
+    tripped = {name: state for name, (state, _) in breaker.snapshot().items()
+               if state != breaker.CLOSED}
+    if tripped:
+        lines.append("\n⚠️ Недоступны: " + ", ".join(
+            f"{name} ({state})" for name, state in sorted(tripped.items())))
     send(admin_id, "\n".join(lines))
 
 def _cmd_streamers(admin_id: int):
     lines = ["📡 Текущее состояние стримеров:\n"]
-    for s in config.STREAMERS:
+    state = live_snapshot()
+    for s in registry.streamers():
         live_platforms = [
             pid for pid in NOTIFY_PLATFORMS
-            if db.get_live(s["id"], pid)
+            if state.get((s["id"], pid))
         ]
         status = "🔴 LIVE: " + ", ".join(live_platforms) if live_platforms else "⚫ офлайн"
         lines.append(f"• {s['name']} — {status}")
     send(admin_id, "\n".join(lines))
 
+def _cmd_latency(admin_id: int):
+    days = 30
+    stats = db.detection_latency(days)
+    if not stats:
+        send(admin_id, f"⏱ За {days} дней эфиров с известным временем начала нет.")
+        return
+    lines = [f"⏱ Задержка обнаружения эфира (медиана за {days} дней):\n"]
+    for pid, (median, count) in sorted(stats.items()):
+        lines.append(f"• {pid}: {median / 60:.1f} мин ({count} эфиров)")
+    send(admin_id, "\n".join(lines))
+
+def _fmt_seconds(value: float | None) -> str:
+    if value is None:
+        return "—"
+    return f"{value * 1000:.0f} мс" if value < 1 else f"{value:.1f} с"
+
+def _cmd_metrics(admin_id: int):
+    lines = ["📈 Метрики с запуска (p50 / p95):\n", "Проверки:"]
+    sources = chk.PROBES.values()
+    for (pid,) in sorted(chk.PROBE_SECONDS.label_sets()):
+        total = chk.PROBE_SECONDS.count(pid)
+        html = sources.get((pid, "html"), 0)
+        unknown = sources.get((pid, "unknown"), 0)
+        lines.append(
+            f"• {pid}: {total}, {_fmt_seconds(chk.PROBE_SECONDS.quantile(0.5, pid))} / "
+            f"{_fmt_seconds(chk.PROBE_SECONDS.quantile(0.95, pid))}, "
+            f"HTML {html * 100 / total:.0f}%, нет ответа {unknown * 100 / total:.0f}%")
+    lines.append(f"\nЦикл: {CYCLE_SECONDS.count()} раз, "
+                 f"{_fmt_seconds(CYCLE_SECONDS.quantile(0.5))} / "
+                 f"{_fmt_seconds(CYCLE_SECONDS.quantile(0.95))} "
+                 f"(интервал {config.CHECK_INTERVAL_SECONDS} с)")
+    db_calls = sum(db.DB_SECONDS.count(*labels) for labels in db.DB_SECONDS.label_sets())
+    slowest = sorted(db.DB_SECONDS.label_sets(),
+                     key=lambda labels: db.DB_SECONDS.quantile(0.95, *labels) or 0)[-3:]
+    lines.append(f"БД: {db_calls} вызовов, медленнее всех: " + ", ".join(
+        f"{fn} {_fmt_seconds(db.DB_SECONDS.quantile(0.95, fn))}" for (fn,) in reversed(slowest)))
+    lines.append("Отправка: " + ", ".join(
+        f"{result} {int(DELIVERIES.value(result))}" for result in ("delivered", "blocked", "failed"))
+        + f"; messages.send {_fmt_seconds(SEND_SECONDS.quantile(0.95, 'bulk'))} (p95)")
+    lines.append(f"Long Poll: {int(sum(LONGPOLL_EVENTS.values().values()))} событий, "
+                 f"обработка {_fmt_seconds(HANDLE_SECONDS.quantile(0.5))} / "
+                 f"{_fmt_seconds(HANDLE_SECONDS.quantile(0.95))}")
+    if config.METRICS_PORT:
+        lines.append(f"\nПолностью: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    send(admin_id, "\n".join(lines))
+
+def _cmd_profile(admin_id: int, arg: str):
+    seconds = int(arg) if arg.isdigit() else 30
+    seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+    if not profiler.start(seconds, lambda text: send(admin_id, text)):
+        send(admin_id, "🔬 Профилирование уже идёт.")
+        return
+    send(admin_id, f"🔬 Профилирую проверки и Long Poll {seconds} с…")
+
+REGISTRY_USAGE = (
+    "Список стримеров:\n"
+    "/add id Имя — добавить\n"
+    "/set id поле значение — поле: " + ", ".join(registry.FIELDS) + " («-» — убрать ссылку)\n"
+    "/del id — удалить вместе с подписками\n"
+    "/reload — перечитать список из БД"
+)
+
+def _cmd_registry(admin_id: int, text: str):
+    cmd, *args = text.split(maxsplit=3)
+    cmd = cmd.lower()
+    try:
+        if cmd == "/add" and len(args) >= 2:
+            snap = registry.add(args[0], text.split(maxsplit=2)[2])
+        elif cmd == "/set" and len(args) == 3:
+            sid, field = args[0].lower(), args[1].lower()
+            snap = registry.set_field(sid, field, args[2])
+            if field in db.STREAMER_LINKS:
+                _reset_source((sid, field))
+        elif cmd == "/del" and len(args) == 1:
+            snap = registry.remove(args[0].lower())
+        elif cmd == "/reload" and not args:
+            snap = registry.reload()
+        else:
+            send(admin_id, REGISTRY_USAGE)
+            return
+    except registry.RegistryError as e:
+        send(admin_id, f"⚠️ {e}")
+        return
+    log.info("Registry %s by admin %s", cmd, admin_id)
+    send(admin_id, f"✅ Готово: стримеров {len(snap.streamers)}, "
+                   f"проверок {len(snap.keys)}. Проверки подхватят изменения "
+                   f"в следующем цикле.")
+
 def _cmd_broadcast(admin_id: int, message: str):
     if not message:
         send(admin_id, "Использование: /broadcast текст сообщения")
         return
     # Собрать всех уникальных подписчиков
     all_users: set[int] = set()
-    for s in config.STREAMERS:
+    for s in registry.streamers():
         all_users.update(db.get_subscribers_of(s["id"]))
-    send(admin_id, f"📤 Рассылка {len(all_users)} пользователям...")
-    send_many(list(all_users), message)
-    send(admin_id, f"✅ Рассылка завершена.")
+    enqueue(f"broadcast:{admin_id}:{time.time_ns()}", list(all_users), message)
+    send(admin_id, f"📤 Рассылка {len(all_users)} пользователям поставлена в очередь.")
     log.info("Broadcast by admin %s: %d users", admin_id, len(all_users))
 
 
+# ─── Состояние стримов ────────────────────────────────────────
+
+# (streamer_id, platform) → в эфире. Единственный источник правды во
+# время работы: читается из БД один раз при старте, а в БД пишутся
+# только изменения — одной транзакцией за цикл.
+_live: dict[tuple[str, str], bool] | None = None
+_live_lock = threading.Lock()
+
+def _live_state() -> dict[tuple[str, str], bool]:
+    global _live
+    with _live_lock:
+        if _live is None:
+            _live = db.get_live_states()
+        return _live
+
+def _live_forget(snap):
+    """Удалённые стримеры: их состояние в БД уже стёрто (db.delete_streamer)."""
+    with _live_lock:
+        if _live is not None:
+            for key in [k for k in _live if k[0] not in snap.by_id]:
+                del _live[key]
+
+registry.on_change(_live_forget)
+
+def _reset_source(key: tuple[str, str]):
+    """
+    Ссылка на площадку сменилась — это другой канал: прошлое «в эфире»
+    к нему не относится. Иначе уже идущий эфир нового канала совпал бы
+    с сохранённым состоянием и уведомления не было бы.
+    """
+    with _live_lock:
+        if _live is not None:
+            _live.pop(key, None)
+    db.set_live(*key, False)
+    _sched.reset(key)
+
+def live_snapshot() -> dict[tuple[str, str], bool]:
+    """Копия текущего состояния — для админ-команд из другого потока."""
+    state = _live_state()
+    with _live_lock:
+        return dict(state)
+
+
 # ─── Цикл проверки стримов ────────────────────────────────────
 
+# Когда проверять каждую площадку каждого стримера (см. scheduler.py)
+_sched = Scheduler()
+_hist_loaded_at = 0.0
+_synced_version = 0
+HIST_REFRESH_SECONDS = 3600
+
 def check_loop():
-    log.info("Checker started (interval=%ds)", config.CHECK_INTERVAL_SECONDS)
+    log.info("Checker started (interval=%ds, tick=%ds)",
+             config.CHECK_INTERVAL_SECONDS, config.SCHED_TICK_SECONDS)
     while True:
         try:
             _do_checks()
         except Exception as e:
             log.error("check_loop unhandled: %s", e)
-        time.sleep(config.CHECK_INTERVAL_SECONDS)
+        time.sleep(config.SCHED_TICK_SECONDS)
 
 
 def _do_checks():
-    for streamer in config.STREAMERS:
-        results = chk.check_streamer(streamer)
-
-        for res in results:
-            pid  = res["platform"]
-            live = res["is_live"]
-            was  = db.get_live(streamer["id"], pid)
-
-            # Уведомляем только реальные стрим-площадки
-            if pid in NOTIFY_PLATFORMS and live and not was:
-                _notify_live(streamer, res)
+    global _hist_loaded_at, _synced_version
+    if time.time() - _hist_loaded_at > HIST_REFRESH_SECONDS:
+        _sched.set_histograms(db.start_histograms(config.SCHED_HISTORY_WEEKS))
+        _sched.set_last_live(db.last_live_times())
+        _hist_loaded_at = time.time()
+    # Список стримеров меняется командами на ходу — расписание
+    # пересобирается, только когда вышел новый снимок
+    reg = registry.current()
+    if reg.version != _synced_version:
+        _sched.sync(reg.keys)
+        _synced_version = reg.version
+    due = _sched.pop_due()
+    # Проверки, не успевшие к концу прошлого цикла, забираются и на
+    # пустом тике: иначе их пары так и не вернутся в расписание
+    if not due and not chk.pending():
+        return
+    with CYCLE_SECONDS.time():
+        _run_checks(due)
+
+
+def _run_checks(due: set[tuple[str, str]]):
+    # Все площадки, которым подошло время, проверяются параллельно,
+    # уведомления рассылаются уже по собранным результатам
+    reg = registry.current()
+    streamers = [reg.by_id[sid] for sid in {sid for sid, _ in due} if sid in reg.by_id]
+    all_results = chk.check_all(streamers, only=due, plans=reg.plans)
+    state = _live_state()
+    changes: list[tuple[str, str, bool]] = []
+    started: list[tuple[str, str, float, float]] = []
+    ended: list[tuple[str, str, float]] = []
+    unrecorded = set(due)   # снятые с расписания и ещё не возвращённые в него
 
-            db.set_live(streamer["id"], pid, live)
+    try:
+        for sid, results in all_results.items():
+            # Результат проверки, начатой до удаления стримера, не нужен
+            streamer = reg.by_id.get(sid)
+            if streamer is None:
+                continue
+            for res in results:
+                pid  = res["platform"]
+                live = res["is_live"]
+                key  = (streamer["id"], pid)
+                was  = state.get(key, False)
+                # None — площадка недоступна (предохранитель разомкнут
+                # или ошибка): ни «стрим закончился», ни «начался»
+                if live is None or live == was:
+                    _sched.record(key, live)
+                    unrecorded.discard(key)
+                    continue
+
+                # Уведомляем только реальные стрим-площадки. Переход
+                # фиксируется после постановки в очередь: если она упала,
+                # эфир остаётся «не начатым» и следующая проверка повторит
+                if pid in NOTIFY_PLATFORMS and live:
+                    try:
+                        _notify_live(streamer, res)
+                    except Exception as e:
+                        log.error("notify %s/%s: %s", streamer["id"], pid, e)
+                        continue
+
+                with _live_lock:
+                    state[key] = live
+                changes.append((streamer["id"], pid, live))
+                if pid in NOTIFY_PLATFORMS:
+                    now = time.time()
+                    if live:
+                        since = res["status"].started_at
+                        started.append((streamer["id"], pid,
+                                        since.timestamp() if since else now, now))
+                    else:
+                        ended.append((streamer["id"], pid, now))
+                _sched.record(key, live)
+                unrecorded.discard(key)
+    finally:
+        # Каждая снятая с расписания пара возвращается в него, что бы ни
+        # случилось выше, — иначе её больше не проверят. Сюда же попадают
+        # переходы с упавшим уведомлением и проверки, не успевшие к концу
+        # цикла (повторная запись лишь переносит срок)
+        for key in unrecorded:
+            _sched.record(key, None)
+        if changes:
+            db.save_transitions(changes, started, ended)
 
 
 def _notify_live(streamer: dict, res: dict):
     pid = res["platform"]
     url = res["url"]
 
-    # Проверяем длительность стрима
-    duration = chk.get_stream_duration(pid, url)
+    # Длительность — из данных, уже полученных при проверке;
+    # отдельный запрос только если площадка не отдала время старта
+    duration = res["status"].minutes()
+    if duration is None:
+        duration = chk.get_stream_duration(pid, url)
 
     if duration > config.MAX_LATE_NOTIFY_MIN:
         log.info("SKIP %s/%s — стрим идёт %d мин (> %d)",
@@ -260,29 +723,81 @@ def _notify_live(streamer: dict, res: dict):
 
     users = db.get_subscribers_of(streamer["id"])
     log.info("LIVE %s/%s ~%dмин → %d users", streamer["id"], pid, duration, len(users))
-    send_many(users, text)
+    # Один и тот же эфир (например, после «мигания» статуса) не разошлётся дважды
+    stream_key = res["status"].stream_id or f"{time.time():.0f}"
+    enqueue(f"live:{streamer['id']}:{pid}:{stream_key}", users, text)
+
+
+# ─── Обработчики сообщений ────────────────────────────────────
 
+class _Dispatcher:
+    """
+    Пул обработчиков входящих сообщений. Пользователь всегда попадает
+    в один и тот же поток (user_id % N) — его сообщения обрабатываются
+    по порядку, а разные пользователи — параллельно. Повторное нажатие
+    той же кнопки, пока прежнее ещё ждёт в очереди, отбрасывается.
+    """
 
-# ─── VK LongPoll — с автоперезапуском ────────────────────────
+    def __init__(self, workers: int):
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._waiting: set[tuple[int, str]] = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i, q in enumerate(self._queues):
+            threading.Thread(target=self._worker, args=(q,), daemon=True,
+                             name=f"handler-{i}").start()
+
+    def submit(self, user_id: int, text: str, payload: dict | None, raw_payload: str):
+        key = (user_id, raw_payload) if payload else None
+        if key:
+            with self._lock:
+                if key in self._waiting:
+                    return
+                self._waiting.add(key)
+        self._queues[user_id % len(self._queues)].put((user_id, text, payload, key))
+
+    def _worker(self, q: queue.Queue):
+        while True:
+            user_id, text, payload, key = q.get()
+            if key:
+                with self._lock:
+                    self._waiting.discard(key)
+            try:
+                with HANDLE_SECONDS.time():
+                    handle(user_id, text, payload)
+            except Exception as e:
+                log.error("handle %s: %s", user_id, e)
+
+_dispatcher = _Dispatcher(config.HANDLER_WORKERS)
+
+
+# ─── VK Bots Long Poll — с автоперезапуском ──────────────────
+
+# VkBotLongPoll заводит свой голый requests.Session — подменяем на
+# сессию transport: пул соединений переживает переподключения,
+# запросы видны в хуках (метрики)
+_lp_session = transport.vk_session()
 
 def poll_loop():
     log.info("LongPoll started")
     while True:
         try:
-            lp = VkLongPoll(vk_session)
+            lp = VkBotLongPoll(vk_session, config.VK_GROUP_ID)
+            lp.session = _lp_session
             for event in lp.listen():
-                if event.type == VkEventType.MESSAGE_NEW and event.to_me:
-                    payload = None
-                    try:
-                        raw = event.extra_values.get("payload")
-                        if raw:
-                            payload = json.loads(raw)
-                    except Exception:
-                        pass
-                    try:
-                        handle(event.user_id, event.text or "", payload)
-                    except Exception as e:
-                        log.error("handle %s: %s", event.user_id, e)
+                LONGPOLL_EVENTS.inc(getattr(event.type, "value", str(event.type)))
+                if event.type != VkBotEventType.MESSAGE_NEW or not event.from_user:
+                    continue
+                msg = event.message
+                raw = msg.get("payload") or ""
+                payload = None
+                try:
+                    if raw:
+                        payload = json.loads(raw)
+                except Exception:
+                    pass
+                _dispatcher.submit(msg["from_id"], msg.get("text") or "", payload, raw)
         except KeyboardInterrupt:
             log.info("Остановка по Ctrl+C")
             sys.exit(0)
@@ -296,10 +811,20 @@ def poll_loop():
 if __name__ == "__main__":
     log.info("=== Бот запускается ===")
     db.init()
+    registry.load()
+    db.outbox_resume()
+    _live_state()
+    transport.add_hook(metrics.http_hook)
+    metrics.serve()
+
+    # Потоки доставки уведомлений
+    for i in range(config.DELIVERY_WORKERS):
+        threading.Thread(target=delivery_loop, daemon=True, name=f"delivery-{i}").start()
 
     # Поток проверки стримов
     t = threading.Thread(target=check_loop, daemon=True, name="checker")
     t.start()
 
-    # Основной поток — VK LongPoll
+    # Основной поток — VK Bots Long Poll, обработка — в пуле
+    _dispatcher.start()
     poll_loop()
@@ -0,0 +1,124 @@
+"""
+breaker.py — предохранители (circuit breakers) для площадок.
+
+Если kick.com или api.vkplay.live лежит, каждая проверка ждала бы
+таймаут, а потом ещё таймаут HTML-запасного пути — и так по всем
+стримерам. Предохранитель считает ошибки и медленные ответы по каждой
+точке доступа отдельно ("kick:api", "kick:html", …):
+  • closed    — запросы идут как обычно;
+  • open      — после BREAKER_FAILURES ошибок подряд (или доли ошибок
+                BREAKER_ERROR_RATE в окне) запросы не делаются вовсе;
+  • half-open — по истечении паузы пропускается один пробный запрос:
+                успех — closed, ошибка — снова open с паузой ×2.
+Замыкает предохранитель только пробный запрос: ответ на запрос,
+отправленный ещё до размыкания, о восстановлении ничего не говорит,
+а его ошибка — не повод размыкать заново и удваивать паузу.
+"""
+import logging, threading, time
+from collections import deque
+import config
+
+log = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class OpenError(Exception):
+    """Предохранитель разомкнут — запрос не выполнялся."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.latency = 0.0          # скользящее среднее, сек
+        self._window: deque[bool] = deque(maxlen=config.BREAKER_WINDOW)
+        self._failures = 0          # ошибок подряд
+        self._cooldown = config.BREAKER_COOLDOWN
+        self._open_until = 0.0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._open_until:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self, elapsed: float):
+        with self._lock:
+            self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+            if self._stale(elapsed):
+                return
+            if elapsed > config.BREAKER_SLOW_SECONDS:
+                self._fail()   # ответ есть, но такой медленный — тоже сбой
+                return
+            self._window.append(True)
+            self._failures = 0
+            if self.state == HALF_OPEN:
+                log.info("breaker %s closed", self.name)
+                self.state = CLOSED
+                self._cooldown = config.BREAKER_COOLDOWN
+                self._window.clear()
+            self._probing = False
+
+    def skip(self):
+        """Запрос не понадобился (ответ из кэша): не успех и не сбой."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False   # пробным будет следующий запрос
+
+    def failure(self, elapsed: float | None = None):
+        with self._lock:
+            if elapsed is not None and self._stale(elapsed):
+                return
+            self._fail()
+
+    def _stale(self, elapsed: float) -> bool:
+        """Запрос ушёл до размыкания: пробным он быть не может, и его
+        ответ (или ошибка) о нынешнем состоянии точки ничего не говорит."""
+        return self.state != CLOSED and time.monotonic() - elapsed < self._opened_at
+
+    def _fail(self):
+        self._window.append(False)
+        self._failures += 1
+        if self.state == HALF_OPEN:
+            self._cooldown = min(self._cooldown * 2, config.BREAKER_MAX_COOLDOWN)
+            self._trip()
+            return
+        errors = self._window.count(False)
+        if self.state == CLOSED and (
+                self._failures >= config.BREAKER_FAILURES or
+                (len(self._window) >= self._window.maxlen // 2 and
+                 errors / len(self._window) >= config.BREAKER_ERROR_RATE)):
+            self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._open_until = self._opened_at + self._cooldown
+        self._probing = False
+        log.warning("breaker %s open for %ds", self.name, self._cooldown)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+
+def get(name: str) -> CircuitBreaker:
+    with _lock:
+        br = _breakers.get(name)
+        if br is None:
+            br = _breakers[name] = CircuitBreaker(name)
+        return br
+
+def snapshot() -> dict[str, tuple[str, float]]:
+    """name → (состояние, средняя задержка)."""
+    with _lock:
+        return {name: (br.state, br.latency) for name, br in _breakers.items()}
@@ -2,30 +2,86 @@
 checker.py — проверка стримов по публичным URL + определение длительности.
 Стримеру не нужно давать никаких прав и доступов.
 """
-import logging, re
+import functools, json, logging, re, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import urlparse
-import requests
-from bs4 import BeautifulSoup
-import config
+import lxml.html
+from lxml import etree
+import config, database as db, transport, breaker, metrics
 
 log = logging.getLogger(__name__)
 
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/122.0.0.0 Safari/537.36"
-    ),
-    "Accept-Language": "ru-RU,ru;q=0.9",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-}
-S = requests.Session()
-S.headers.update(HEADERS)
+# Все запросы проверок идут через общую сессию transport:
+# пулы соединений по хостам, повторы, таймауты и кэш страниц.
+S = transport.session
+
+
+# ─── Результат проверки ────────────────────────────────────────
+
+@dataclass
+class StreamStatus:
+    """
+    Что удалось узнать о стриме за одну проверку.
+    bool(status) — идёт ли эфир, поэтому его можно проверять как раньше.
+    is_live=None — площадка недоступна, состояние неизвестно.
+    """
+    is_live: bool | None
+    started_at: datetime | None = None
+    title: str = ""
+    viewers: int | None = None
+    stream_id: str = ""
+    source: str = ""   # "api", "html" или "unknown"
+
+    def __bool__(self) -> bool:
+        return bool(self.is_live)
+
+    def minutes(self) -> int | None:
+        """Минуты с начала эфира или None, если время старта неизвестно."""
+        if not (self.is_live and self.started_at):
+            return None
+        return int((datetime.now(timezone.utc) - self.started_at).total_seconds() / 60)
 
 
 # ─── Вспомогательные функции ───────────────────────────────────
 
+def _unknown() -> StreamStatus:
+    """Площадка не ответила — не «оффлайн», а «не знаем»."""
+    return StreamStatus(None, source="unknown")
+
+@contextmanager
+def _guard(name: str):
+    """
+    Запрос к точке доступа площадки через её предохранитель.
+    Разомкнут — breaker.OpenError без запроса; исключение внутри
+    блока — ошибка, нормальный выход — успех с замером времени.
+    Блок, не отправивший ни одного запроса (всё из кэша), не считается,
+    как и вышедший срок цикла (transport.DeadlineExceeded).
+    """
+    br = breaker.get(name)
+    if not br.allow():
+        raise breaker.OpenError(name)
+    sent = transport.sent()
+    started = time.monotonic()
+    try:
+        yield
+    except transport.DeadlineExceeded:
+        br.skip()
+        raise
+    except Exception:
+        br.failure(time.monotonic() - started)
+        raise
+    if transport.sent() == sent:
+        br.skip()
+    else:
+        br.success(time.monotonic() - started)
+
+# Разбор ссылок кэшируется: ссылки стримеров меняются редко, а
+# проверяются каждый цикл (plan() прогревает кэш при загрузке списка)
+@functools.lru_cache(maxsize=None)
 def _slug(url: str) -> str:
     if not url:
         return ""
@@ -33,7 +89,9 @@ def _slug(url: str) -> str:
     parts = [p for p in path if p and p not in ("live", "stream", "streams", "c", "user")]
     return parts[-1].lstrip("@") if parts else ""
 
-def _yt_channel_id(url: str) -> str:
+@functools.lru_cache(maxsize=None)
+def _yt_channel_key(url: str) -> str:
+    """Ключ канала из ссылки: UC…, @handle, c/name или user/name."""
     path = urlparse(url).path.strip("/").split("/")
     for i, p in enumerate(path):
         if p == "channel" and i + 1 < len(path):
@@ -41,7 +99,7 @@ def _yt_channel_id(url: str) -> str:
         if p.startswith("@"):
             return p
         if p in ("c", "user") and i + 1 < len(path):
-            return path[i + 1]
+            return f"{p}/{path[i + 1]}"
     return path[-1] if path else ""
 
 def _is_stream_post(text: str) -> bool:
@@ -52,6 +110,40 @@ def _is_stream_post(text: str) -> bool:
     hits = sum(1 for kw in config.STREAM_KEYWORDS if kw in text_lower)
     return hits >= config.KEYWORD_MIN_MATCHES
 
+def _parse_time(value) -> datetime | None:
+    """ISO-строка ('…Z', '2024-01-01 12:00:00') или unix-время → datetime UTC."""
+    if not value:
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value, timezone.utc)
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+def _to_int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Страницы площадок весят сотни килобайт, а нужен из них один-два узла.
+# Поэтому дерево строится не по всей странице: регулярка находит начало
+# нужного узла, и lxml разбирает только кусок HTML от него.
+_SLICE_CHARS = 4096
+
+def _first_node(html: str, start: re.Pattern, xpath: etree.XPath):
+    m = start.search(html)
+    if not m:
+        return None
+    nodes = xpath(lxml.html.fromstring(html[m.start():m.start() + _SLICE_CHARS]))
+    return nodes[0] if nodes else None
+
+def _node_text(node) -> str:
+    """Как BeautifulSoup get_text(strip=True): куски текста без пробелов."""
+    return "".join(t.strip() for t in node.itertext())
+
 def _parse_timer(time_str: str) -> int:
     """'HH:MM:SS' или 'MM:SS' → минуты."""
     try:
@@ -67,57 +159,180 @@ def _parse_timer(time_str: str) -> int:
 
 # ─── Twitch ────────────────────────────────────────────────────
 
-_tw_token: str | None = None
+class _TwitchToken:
+    """
+    App access token Twitch (client credentials).
+    Обновляется заранее, до истечения expires_in, и сразу после 401.
+    Хранится в БД, чтобы после перезапуска не ходить за новым.
+    """
+    REFRESH_AHEAD = 3600   # обновить за час до истечения,
+                           # но не раньше последней десятой срока жизни
 
-def _tw_oauth() -> str | None:
-    global _tw_token
-    if _tw_token:
-        return _tw_token
-    if not (config.TWITCH_CLIENT_ID and config.TWITCH_CLIENT_SECRET):
-        return None
-    try:
-        r = S.post("https://id.twitch.tv/oauth2/token", params={
-            "client_id": config.TWITCH_CLIENT_ID,
-            "client_secret": config.TWITCH_CLIENT_SECRET,
-            "grant_type": "client_credentials",
-        }, timeout=10)
-        _tw_token = r.json().get("access_token")
-        return _tw_token
-    except Exception as e:
-        log.error("Twitch OAuth: %s", e)
-        return None
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._loaded = False
+
+    @staticmethod
+    def _key() -> str:
+        return f"twitch:{config.TWITCH_CLIENT_ID}"
+
+    def get(self) -> str | None:
+        if not (config.TWITCH_CLIENT_ID and config.TWITCH_CLIENT_SECRET):
+            return None
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    saved = db.get_token(self._key())
+                except Exception as e:
+                    log.warning("Twitch token cache: %s", e)
+                    saved = None
+                if saved:
+                    self._set(*saved)
+            now = time.time()
+            if self._token and now < self._refresh_at:
+                return self._token
+            if self._refresh():
+                return self._token
+            # Не удалось обновить — старый токен ещё годится до истечения
+            return self._token if now < self._expires_at else None
+
+    def invalidate(self, token: str):
+        """Токен отвергнут API (401) — следующий get() возьмёт новый."""
+        with self._lock:
+            if self._token == token:
+                self._token, self._expires_at, self._refresh_at = None, 0.0, 0.0
+
+    def _set(self, token: str, expires_at: float):
+        """Запомнить токен; срок обновления — от оставшейся жизни токена,
+        чтобы короткий токен не считался «истекающим» с первой секунды."""
+        self._token, self._expires_at = token, expires_at
+        lifetime = max(0.0, expires_at - time.time())
+        self._refresh_at = expires_at - min(self.REFRESH_AHEAD, lifetime / 10)
+
+    def _refresh(self) -> bool:
+        try:
+            r = S.post("https://id.twitch.tv/oauth2/token", params={
+                "client_id": config.TWITCH_CLIENT_ID,
+                "client_secret": config.TWITCH_CLIENT_SECRET,
+                "grant_type": "client_credentials",
+            }, timeout=10)
+            data = r.json()
+            token = data.get("access_token")
+            if not token:
+                log.error("Twitch OAuth: %s", data.get("message", r.status_code))
+                return False
+        except Exception as e:
+            log.error("Twitch OAuth: %s", e)
+            return False
+        self._set(token, time.time() + float(data.get("expires_in", 3600)))
+        try:
+            db.set_token(self._key(), self._token, self._expires_at)
+        except Exception as e:
+            log.warning("Twitch token cache: %s", e)
+        return True
+
+_tw_token = _TwitchToken()
+
+def _tw_helix(params) -> list[dict] | None:
+    """
+    GET helix/streams. Список стримов или None при ошибке.
+    На 401 токен обновляется и запрос повторяется один раз.
+    """
+    for attempt in range(2):
+        token = _tw_token.get()
+        if not token:
+            return None
+        with _guard("twitch:api"):
+            r = S.get_hedged("https://api.twitch.tv/helix/streams", params=params,
+                      headers={"Client-ID": config.TWITCH_CLIENT_ID,
+                               "Authorization": f"Bearer {token}"},
+                      timeout=10)
+            transport.raise_for_outage(r)
+        if r.status_code == 401 and attempt == 0:
+            log.info("Twitch token rejected, refreshing")
+            _tw_token.invalidate(token)
+            continue
+        data = r.json().get("data")
+        if data is None:
+            log.warning("Twitch API %s: %s", r.status_code, r.text[:200])
+        return data
+    return None
+
+# Результаты пакетного запроса Helix за текущий цикл:
+# login → данные стрима ({} — точно оффлайн). Заполняется в начале
+# check_all, им пользуются и check_twitch, и get_duration_twitch.
+_tw_batch: dict[str, dict] = {}
+TW_BATCH_SIZE = 100  # Helix принимает до 100 user_login за запрос
+
+def _tw_prefetch(logins: list[str]):
+    """Статус всех логинов за ceil(N/100) запросов к Helix."""
+    global _tw_batch
+    batch: dict[str, dict] = {}
+    logins = list(dict.fromkeys(l.lower() for l in logins if l))
+    for i in range(0, len(logins), TW_BATCH_SIZE):
+        chunk = logins[i:i + TW_BATCH_SIZE]
+        try:
+            data = _tw_helix([("user_login", l) for l in chunk] + [("first", 100)])
+        except Exception as e:
+            log.warning("Twitch batch: %s", e)
+            continue
+        if data is None:
+            continue
+        live = {d.get("user_login", "").lower(): d for d in data}
+        for login in chunk:
+            batch[login] = live.get(login, {})
+    _tw_batch = batch
 
 def _tw_stream_data(login: str) -> dict | None:
-    """Возвращает данные стрима из Twitch API или None."""
-    token = _tw_oauth()
-    if not token:
-        return None
+    """
+    Данные стрима из Twitch API: dict — в эфире, {} — оффлайн,
+    None — API недоступен.
+    """
+    cached = _tw_batch.get(login.lower())
+    if cached is not None:
+        return cached
     try:
-        r = S.get("https://api.twitch.tv/helix/streams",
-                  params={"user_login": login},
-                  headers={"Client-ID": config.TWITCH_CLIENT_ID,
-                           "Authorization": f"Bearer {token}"},
-                  timeout=10)
-        data = r.json().get("data", [])
-        return data[0] if data else None
+        data = _tw_helix({"user_login": login})
     except Exception as e:
         log.warning("Twitch API: %s", e)
         return None
+    if data is None:
+        return None
+    return data[0] if data else {}
 
-def check_twitch(url: str) -> bool:
+def _tw_status(stream: dict) -> StreamStatus:
+    if not stream:
+        return StreamStatus(False, source="api")
+    return StreamStatus(True,
+                        started_at=_parse_time(stream.get("started_at")),
+                        title=stream.get("title", ""),
+                        viewers=_to_int(stream.get("viewer_count")),
+                        stream_id=str(stream.get("id", "")),
+                        source="api")
+
+def _tw_html_live(html: str) -> bool:
+    return "isLiveBroadcast" in html or "В ЭФИРЕ" in html
+
+def check_twitch(url: str) -> StreamStatus:
     login = _slug(url)
     if not login:
-        return False
+        return StreamStatus(False)
     stream = _tw_stream_data(login)
     if stream is not None:
-        return True
+        return _tw_status(stream)
     # Fallback HTML
     try:
-        r = S.get(url, timeout=15)
-        return "isLiveBroadcast" in r.text or "В ЭФИРЕ" in r.text
+        with _guard("twitch:html"):
+            return StreamStatus(S.get_cached(url, _tw_html_live), source="html")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("Twitch HTML: %s", e)
-    return False
+    return _unknown()
 
 def get_duration_twitch(url: str) -> int:
     """Минуты с начала стрима на Twitch (через API)."""
@@ -125,108 +340,288 @@ def get_duration_twitch(url: str) -> int:
     if not login:
         return 0
     stream = _tw_stream_data(login)
-    if stream:
-        started_at = stream.get("started_at", "")
-        if started_at:
-            try:
-                start = datetime.fromisoformat(started_at.replace("Z", "+00:00"))
-                return int((datetime.now(timezone.utc) - start).total_seconds() / 60)
-            except Exception:
-                pass
-    return 0
+    return (stream and _tw_status(stream).minutes()) or 0
 
 
 # ─── YouTube ───────────────────────────────────────────────────
+#
+# search.list стоит 100 единиц квоты, поэтому им не пользуемся:
+#   1. @handle → UC… один раз (channels.list, 1 единица), кэш в БД;
+#   2. кандидаты — последние ролики из RSS канала (бесплатно),
+#      при ошибке — из плейлиста загрузок (1 единица);
+#   3. подтверждение — videos.list пачками по 50 ID (1 единица).
+#      Ролики, которые уже не станут эфиром (обычные загрузки и
+#      закончившиеся трансляции), запоминаются и больше не запрашиваются:
+#      квоту тратят только новые и запланированные ролики.
 
-def _yt_live_video_id(ch_id: str) -> str | None:
-    if not config.YOUTUBE_API_KEY:
+YT_API = "https://www.googleapis.com/youtube/v3"
+YT_BATCH_SIZE = 50     # videos.list принимает до 50 ID
+YT_CANDIDATES = 5      # сколько последних роликов канала проверять
+YT_DONE_MAX = 100_000  # сколько «отыгравших» роликов помнить
+YT_FEEDS_SHARE = 0.7   # доля срока на ленты каналов, остальное — videos.list
+
+_yt_ids: dict[str, str] | None = None   # ключ канала → UC…
+_yt_ids_lock = threading.Lock()
+_YT_ID_RE = re.compile(r'"(?:externalId|channelId)":"(UC[\w-]{22})"')
+_YT_FEED_RE = re.compile(r"<yt:videoId>([\w-]{11})</yt:videoId>")
+
+# Результат пакетной проверки за текущий цикл:
+# UC… → ролик с liveStreamingDetails ({} — точно оффлайн).
+_yt_batch: dict[str, dict] = {}
+
+# ID роликов, которые эфиром уже не будут (порядок — для вытеснения старых)
+_yt_done: OrderedDict[str, None] = OrderedDict()
+_yt_done_lock = threading.Lock()
+
+def _yt_finished(item: dict) -> bool:
+    """Обычная загрузка или закончившийся эфир — живым этот ролик не станет."""
+    details = item.get("liveStreamingDetails")
+    return not details or bool(details.get("actualEndTime"))
+
+def _yt_api(method: str, **params) -> dict:
+    with _guard("youtube:api"):
+        r = S.get_hedged(f"{YT_API}/{method}",
+                  params={**params, "key": config.YOUTUBE_API_KEY}, timeout=10)
+        transport.raise_for_outage(r)
+        data = r.json()
+        # quotaExceeded и прочие отказы — тоже повод не дёргать API
+        if "error" in data:
+            raise RuntimeError(data["error"].get("message", data["error"]))
+    return data
+
+def _yt_resolve(key: str, url: str) -> str | None:
+    """Найти UC… по @handle / c/ / user/ — через API, иначе по HTML."""
+    try:
+        if key.startswith("@"):
+            items = _yt_api("channels", part="id", forHandle=key).get("items", [])
+            if items:
+                return items[0]["id"]
+        elif key.startswith("user/"):
+            items = _yt_api("channels", part="id",
+                            forUsername=key[len("user/"):]).get("items", [])
+            if items:
+                return items[0]["id"]
+    except Exception as e:
+        log.warning("YT channels API: %s", e)
+    page = url[:-len("/live")] if url.endswith("/live") else url
+    try:
+        with _guard("youtube:html"):
+            r = S.get(page, timeout=15)
+            transport.raise_for_outage(r)
+        m = _YT_ID_RE.search(r.text)
+        if m:
+            return m.group(1)
+    except Exception as e:
+        log.warning("YT channel page: %s", e)
+    return None
+
+def _yt_channel_id(url: str) -> str | None:
+    """UC… канала по ссылке. Найденные ID кэшируются в БД навсегда."""
+    global _yt_ids
+    key = _yt_channel_key(url)
+    if key.startswith("UC") and len(key) == 24:
+        return key
+    if not key:
         return None
+    with _yt_ids_lock:
+        if _yt_ids is None:
+            try:
+                _yt_ids = db.get_yt_channels()
+            except Exception as e:
+                log.warning("YT channel cache: %s", e)
+                _yt_ids = {}
+        ch_id = _yt_ids.get(key)
+    if ch_id:
+        return ch_id
+    ch_id = _yt_resolve(key, url)
+    if ch_id:
+        with _yt_ids_lock:
+            _yt_ids[key] = ch_id
+        try:
+            db.set_yt_channel(key, ch_id)
+        except Exception as e:
+            log.warning("YT channel cache: %s", e)
+    return ch_id
+
+def _yt_candidates(ch_id: str) -> list[str] | None:
+    """Последние ролики канала. None — не удалось узнать."""
     try:
-        r = S.get("https://www.googleapis.com/youtube/v3/search", params={
-            "part": "snippet", "channelId": ch_id,
-            "eventType": "live", "type": "video",
-            "key": config.YOUTUBE_API_KEY,
-        }, timeout=10)
-        items = r.json().get("items", [])
-        return items[0]["id"]["videoId"] if items else None
+        with _guard("youtube:feed"):
+            r = S.get("https://www.youtube.com/feeds/videos.xml",
+                      params={"channel_id": ch_id}, timeout=10)
+            transport.raise_for_outage(r)
+        if r.status_code == 200:
+            return _YT_FEED_RE.findall(r.text)[:YT_CANDIDATES]
+    except transport.DeadlineExceeded:
+        return None     # срок вышел — и плейлист уже не успеть
+    except Exception as e:
+        log.warning("YT feed: %s", e)
+    try:
+        items = _yt_api("playlistItems", part="contentDetails",
+                        playlistId="UU" + ch_id[2:],
+                        maxResults=YT_CANDIDATES).get("items", [])
+        return [it["contentDetails"]["videoId"] for it in items]
     except Exception as e:
-        log.warning("YT search API: %s", e)
+        log.warning("YT uploads API: %s", e)
+    return None
+
+def _yt_lookup(ch_ids: list[str]) -> dict[str, dict]:
+    """
+    Текущий эфир каждого канала: ролик из videos.list или {}.
+    Каналы, для которых ответа нет, в результат не попадают.
+    """
+    ch_ids = list(dict.fromkeys(ch_ids))
+    # Одиночный запрос может прийти из потока пула — не ждём сами себя
+    mapper = _pool_map if len(ch_ids) > 1 else map
+    # Ленты — по запросу на канал; часть срока оставляем на videos.list,
+    # иначе под нагрузкой ленты съедят весь срок и не подтвердится ничего
+    at = transport.current_deadline()
+    now = time.monotonic()
+    with transport.deadline(None if at is None else now + (at - now) * YT_FEEDS_SHARE):
+        candidates = dict(zip(ch_ids, mapper(_yt_candidates, ch_ids)))
+    with _yt_done_lock:
+        owner = {vid: ch for ch, vids in candidates.items() if vids
+                 for vid in vids if vid not in _yt_done}
+    found = {ch: {} for ch, vids in candidates.items() if vids is not None}
+    vids = list(owner)
+    for i in range(0, len(vids), YT_BATCH_SIZE):
+        chunk = vids[i:i + YT_BATCH_SIZE]
+        try:
+            items = _yt_api("videos", part="snippet,liveStreamingDetails",
+                            id=",".join(chunk)).get("items", [])
+        except Exception as e:
+            log.warning("YT videos API: %s", e)
+            for vid in chunk:
+                found.pop(owner[vid], None)
+            continue
+        finished = []
+        for item in items:
+            details = item.get("liveStreamingDetails", {})
+            if (item.get("snippet", {}).get("liveBroadcastContent") == "live"
+                    and details.get("actualStartTime")
+                    and not details.get("actualEndTime")):
+                found[owner[item["id"]]] = item
+            elif _yt_finished(item):
+                finished.append(item["id"])
+        with _yt_done_lock:
+            for vid in finished:
+                _yt_done[vid] = None
+            while len(_yt_done) > YT_DONE_MAX:
+                _yt_done.popitem(last=False)
+    return found
+
+def _yt_prefetch(urls: list[str]):
+    global _yt_batch
+    if not config.YOUTUBE_API_KEY:
+        return
+    ch_ids = [ch for ch in _pool_map(_yt_channel_id, [u for u in urls if u]) if ch]
+    _yt_batch = _yt_lookup(ch_ids) if ch_ids else {}
+
+def _yt_live_video(url: str) -> dict | None:
+    """Ролик текущего эфира ({} — оффлайн, None — API недоступен)."""
+    if not config.YOUTUBE_API_KEY:
         return None
+    ch_id = _yt_channel_id(url)
+    if not ch_id:
+        return None
+    if ch_id in _yt_batch:
+        return _yt_batch[ch_id]
+    return _yt_lookup([ch_id]).get(ch_id)
+
+def _yt_status(video: dict) -> StreamStatus:
+    if not video:
+        return StreamStatus(False, source="api")
+    details = video.get("liveStreamingDetails", {})
+    return StreamStatus(True,
+                        started_at=_parse_time(details.get("actualStartTime")),
+                        title=video.get("snippet", {}).get("title", ""),
+                        viewers=_to_int(details.get("concurrentViewers")),
+                        stream_id=video.get("id", ""),
+                        source="api")
 
-def check_youtube(url: str) -> bool:
+def _yt_html_live(html: str) -> bool:
+    return ('"liveBroadcastContent":"live"' in html or
+            "isLiveBroadcast" in html or "ЭФИР" in html)
+
+def check_youtube(url: str) -> StreamStatus:
     if not url:
-        return False
-    if config.YOUTUBE_API_KEY:
-        ch_id = _yt_channel_id(url)
-        vid = _yt_live_video_id(ch_id)
-        if vid is not None:
-            return bool(vid)
+        return StreamStatus(False)
+    video = _yt_live_video(url)
+    if video is not None:
+        return _yt_status(video)
     live_url = url if url.endswith("/live") else url.rstrip("/") + "/live"
     try:
-        r = S.get(live_url, timeout=15)
-        return ('"liveBroadcastContent":"live"' in r.text or
-                "isLiveBroadcast" in r.text or "ЭФИР" in r.text)
+        with _guard("youtube:html"):
+            return StreamStatus(S.get_cached(live_url, _yt_html_live), source="html")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("YT HTML: %s", e)
-    return False
+    return _unknown()
 
 def get_duration_youtube(url: str) -> int:
     """Минуты с начала стрима на YouTube (через API)."""
-    if not config.YOUTUBE_API_KEY:
-        return 0
-    ch_id = _yt_channel_id(url)
-    vid = _yt_live_video_id(ch_id)
-    if not vid:
-        return 0
-    try:
-        r = S.get("https://www.googleapis.com/youtube/v3/videos", params={
-            "part": "liveStreamingDetails", "id": vid,
-            "key": config.YOUTUBE_API_KEY,
-        }, timeout=10)
-        start_str = (r.json().get("items", [{}])[0]
-                     .get("liveStreamingDetails", {})
-                     .get("actualStartTime", ""))
-        if start_str:
-            start = datetime.fromisoformat(start_str.replace("Z", "+00:00"))
-            return int((datetime.now(timezone.utc) - start).total_seconds() / 60)
-    except Exception as e:
-        log.error("YT duration: %s", e)
-    return 0
+    video = _yt_live_video(url)
+    return (video and _yt_status(video).minutes()) or 0
 
 
 # ─── Kick ──────────────────────────────────────────────────────
 
 def _kick_data(login: str) -> dict | None:
     try:
-        r = S.get(f"https://kick.com/api/v1/channels/{login}", timeout=15)
-        return r.json()
+        with _guard("kick:api"):
+            r = S.get_hedged(f"https://kick.com/api/v1/channels/{login}", timeout=15)
+            transport.raise_for_outage(r)
+            return r.json()
     except Exception:
         return None
 
-def check_kick(url: str) -> bool:
+def _kick_html_live(html: str) -> bool:
+    return "bg-green-500" in html and "LIVE" in html
+
+_KICK_TIMER_START = re.compile(r"""<span\b[^>]*\bclass=["'][^"']*tabular-nums""")
+_KICK_TIMER_XPATH = etree.XPath("descendant-or-self::span[contains(@class, 'tabular-nums')]")
+
+def _kick_timer(html: str) -> int:
+    timer = _first_node(html, _KICK_TIMER_START, _KICK_TIMER_XPATH)
+    if timer is not None:
+        text = _node_text(timer)
+        if ":" in text:
+            return _parse_timer(text)
+    return 0
+
+def check_kick(url: str) -> StreamStatus:
     login = _slug(url)
     if not login:
-        return False
+        return StreamStatus(False)
     data = _kick_data(login)
     if data is not None:
-        return bool(data.get("livestream"))
+        stream = data.get("livestream")
+        if not stream:
+            return StreamStatus(False, source="api")
+        return StreamStatus(True,
+                            started_at=_parse_time(stream.get("start_time")
+                                                   or stream.get("created_at")),
+                            title=stream.get("session_title", ""),
+                            viewers=_to_int(stream.get("viewer_count")),
+                            stream_id=str(stream.get("id", "")),
+                            source="api")
     try:
-        r = S.get(url, timeout=15)
-        return "bg-green-500" in r.text and "LIVE" in r.text
+        with _guard("kick:html"):
+            return StreamStatus(S.get_cached(url, _kick_html_live), source="html")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("Kick: %s", e)
-    return False
+    return _unknown()
 
 def get_duration_kick(url: str) -> int:
     """Минуты с начала стрима на Kick (через HTML таймер)."""
     try:
-        r = S.get(url, timeout=15)
-        soup = BeautifulSoup(r.text, "html.parser")
-        timer = soup.find("span", class_=lambda c: c and "tabular-nums" in c)
-        if timer:
-            text = timer.get_text(strip=True)
-            if ":" in text:
-                return _parse_timer(text)
+        with _guard("kick:html"):
+            return S.get_cached(url, _kick_timer)
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("Kick duration: %s", e)
     return 0
@@ -240,86 +635,239 @@ def _vkplay_inner(data) -> dict | list | None:
         return data.get("data")
     return data
 
-def check_vkplay(url: str) -> bool:
+def _vkplay_html_live(html: str) -> bool:
+    return "StreamStatus_isOnline" in html or '"isOnline":true' in html
+
+_VKPLAY_TIMER_START = re.compile(r"""<\w+\b[^>]*\bclass=["'][^"']*ChannelStreamPanel_timer""")
+_VKPLAY_TIMER_XPATH = etree.XPath("descendant-or-self::*[contains(@class, 'ChannelStreamPanel_timer')]")
+
+def _vkplay_timer(html: str) -> int:
+    timer = _first_node(html, _VKPLAY_TIMER_START, _VKPLAY_TIMER_XPATH)
+    return _parse_timer(_node_text(timer)) if timer is not None else 0
+
+def _vkplay_status(item: dict) -> StreamStatus:
+    count = item.get("count")
+    return StreamStatus(True,
+                        started_at=_parse_time(item.get("startTime")),
+                        title=item.get("title", ""),
+                        viewers=_to_int(count.get("viewers")) if isinstance(count, dict) else None,
+                        stream_id=str(item.get("id", "")),
+                        source="api")
+
+def check_vkplay(url: str) -> StreamStatus:
     login = _slug(url)
     if not login:
-        return False
+        return StreamStatus(False)
     try:
-        r = S.get(f"https://api.vkplay.live/v1/blog/{login}/public_video_stream", timeout=15)
-        inner = _vkplay_inner(r.json())
+        with _guard("vkplay:api"):
+            r = S.get_hedged(f"https://api.vkplay.live/v1/blog/{login}/public_video_stream",
+                             timeout=15)
+            transport.raise_for_outage(r)
+            data = r.json()
+        inner = _vkplay_inner(data)
+        if isinstance(inner, dict):
+            inner = [inner]
         if isinstance(inner, list):
-            return any(item.get("isOnline") for item in inner if isinstance(item, dict))
-        elif isinstance(inner, dict):
-            return bool(inner.get("isOnline"))
+            for item in inner:
+                if isinstance(item, dict) and item.get("isOnline"):
+                    return _vkplay_status(item)
+            return StreamStatus(False, source="api")
     except Exception:
         pass
     try:
-        r = S.get(url, timeout=15)
-        return "StreamStatus_isOnline" in r.text or '"isOnline":true' in r.text
+        with _guard("vkplay:html"):
+            return StreamStatus(S.get_cached(url, _vkplay_html_live), source="html")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("VKPlay: %s", e)
-    return False
+    return _unknown()
 
 def get_duration_vkplay(url: str) -> int:
     """Минуты с начала стрима на VK Play Live (через HTML таймер)."""
     try:
-        r = S.get(url, timeout=15)
-        soup = BeautifulSoup(r.text, "html.parser")
-        timer = soup.find(class_=lambda c: c and "ChannelStreamPanel_timer" in c)
-        if timer:
-            return _parse_timer(timer.get_text(strip=True))
+        with _guard("vkplay:html"):
+            return S.get_cached(url, _vkplay_timer)
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("VKPlay duration: %s", e)
     return 0
 
 
+# ─── Лента постов (Telegram и ВК) ─────────────────────────────
+#
+# Для каждой ленты в БД хранится курсор: id последнего просмотренного
+# поста и время последнего поста о стриме. Ключевые слова проверяются
+# только у новых постов, а «в эфире» лента считается, пока пост о
+# стриме не старше STREAM_POST_TTL_MIN.
+
+def _feed_cursor(source: str) -> tuple[int, float | None]:
+    return db.get_feed_cursor(source)
+
+def _feed_scan(source: str, cursor: tuple[int, float | None],
+               posts: list[tuple[int, float | None, str]], kind: str) -> StreamStatus:
+    """posts — новые посты (id, unix-время, текст) по возрастанию id."""
+    last_id, live_at = cursor
+    new_last, new_live = last_id, live_at
+    for post_id, when, text in posts:
+        new_last = max(new_last, post_id)
+        if _is_stream_post(text):
+            when = when or time.time()
+            new_live = max(new_live or 0, when)
+    if (new_last, new_live) != (last_id, live_at):
+        db.set_feed_cursor(source, new_last, new_live)
+    live = bool(new_live) and time.time() - new_live < config.STREAM_POST_TTL_MIN * 60
+    return StreamStatus(live,
+                        started_at=_parse_time(new_live) if live else None,
+                        source=kind)
+
+
 # ─── Telegram ─────────────────────────────────────────────────
 
-def check_telegram(url: str) -> bool:
+TG_LAST_POSTS = 5
+_TG_WRAP_MARK = 'class="tgme_widget_message_wrap'
+_TG_WRAP_XPATH = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' tgme_widget_message_wrap ')]")
+_TG_POST_ID_RE = re.compile(r'data-post="[^"/]+/(\d+)"')
+
+def _tg_post_ids(html: str) -> list[tuple[int, int]]:
+    """(id поста, позиция в HTML) всех постов страницы — без разбора дерева."""
+    return [(int(m.group(1)), m.start()) for m in _TG_POST_ID_RE.finditer(html)]
+
+def _tg_new_posts(html: str, ids: list[tuple[int, int]],
+                  after_id: int) -> list[tuple[int, float | None, str]]:
+    """
+    Посты новее after_id: (id, unix-время, текст со ссылками).
+    lxml разбирает только хвост страницы, начиная с первого нового поста.
+    """
+    fresh = [(pid, pos) for pid, pos in ids if pid > after_id]
+    if not after_id:
+        fresh = fresh[-TG_LAST_POSTS:]   # первый проход — как раньше, 5 последних
+    if not fresh:
+        return []
+    wrap = html.rfind(_TG_WRAP_MARK, 0, fresh[0][1])
+    start = html.rfind("<div", 0, wrap if wrap >= 0 else fresh[0][1])
+    posts = []
+    for post in _TG_WRAP_XPATH(lxml.html.document_fromstring(html[max(start, 0):])):
+        ref = next(iter(post.xpath(".//@data-post")), "")
+        post_id = _to_int(ref.rpartition("/")[2])
+        if not post_id or post_id <= after_id:
+            continue
+        when = _parse_time(next(iter(post.xpath(".//time/@datetime")), None))
+        text = " ".join(post.itertext()) + " " + " ".join(post.xpath(".//a/@href"))
+        posts.append((post_id, when.timestamp() if when else None, text))
+    return posts
+
+def check_telegram(url: str) -> StreamStatus:
     channel = _slug(url)
     if not channel:
-        return False
+        return StreamStatus(False)
+    page = f"https://t.me/s/{channel}"
     try:
-        r = S.get(f"https://t.me/s/{channel}", timeout=15)
-        soup = BeautifulSoup(r.text, "html.parser")
-        posts = soup.find_all(class_="tgme_widget_message_wrap")[-5:]
-        for post in posts:
-            text = post.get_text(separator=" ")
-            links = [a.get("href", "") for a in post.find_all("a")]
-            if _is_stream_post(text + " " + " ".join(links)):
-                return True
+        with _guard("telegram:html"):
+            ids = S.get_cached(page, _tg_post_ids)
+            html = S.get_cached(page)
+        source = f"telegram:{channel.lower()}"
+        cursor = _feed_cursor(source)
+        posts = []
+        if ids and ids[-1][0] > cursor[0]:
+            posts = _tg_new_posts(html, ids, cursor[0])
+        return _feed_scan(source, cursor, posts, "html")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("Telegram: %s", e)
-    return False
+    return _unknown()
 
 
 # ─── VK группа ────────────────────────────────────────────────
 
-def check_vk_group(url: str) -> bool:
+def _vk_post_text(post: dict) -> str:
+    text = post.get("text", "")
+    attachments = post.get("attachments", [])
+    extra = " ".join(a.get("link", {}).get("url", "")
+                     for a in attachments if a.get("type") == "link")
+    inline = " ".join(re.findall(r'https?://\S+', text))
+    return text + " " + extra + " " + inline
+
+VK_API = "https://api.vk.com/method"
+VK_API_VERSION = "5.199"
+VK_WALL_COUNT = 5
+VK_EXECUTE_BATCH = 25   # execute выполняет не больше 25 вызовов API
+_VK_DOMAIN_RE = re.compile(r"^[\w.]+$")
+
+# Посты стен за текущий цикл: domain → items из wall.get.
+# Заполняется пакетно через execute в начале check_all.
+_vk_batch: dict[str, list[dict]] = {}
+
+def _vk_prefetch(domains: list[str]):
+    """Стены всех групп за ceil(N/25) запросов execute."""
+    global _vk_batch
+    batch: dict[str, list[dict]] = {}
+    domains = list(dict.fromkeys(d.lower() for d in domains
+                                 if d and _VK_DOMAIN_RE.match(d)))
+    for i in range(0, len(domains), VK_EXECUTE_BATCH):
+        chunk = domains[i:i + VK_EXECUTE_BATCH]
+        code = "return [" + ",".join(
+            f'API.wall.get({{"domain":{json.dumps(d)},"count":{VK_WALL_COUNT}}})'
+            for d in chunk) + "];"
+        try:
+            with _guard("vk_group:api"):
+                r = S.post(f"{VK_API}/execute", data={
+                    "code": code,
+                    "access_token": config.VK_SERVICE_TOKEN, "v": VK_API_VERSION,
+                }, timeout=10)
+                transport.raise_for_outage(r)
+                data = r.json()
+            if "error" in data:
+                log.warning("VK execute: %s", data["error"].get("error_msg"))
+                continue
+            # Неудачный вызов внутри execute возвращает false
+            for domain, wall in zip(chunk, data.get("response") or []):
+                if isinstance(wall, dict):
+                    batch[domain] = wall.get("items", [])
+        except Exception as e:
+            log.warning("VK execute: %s", e)
+    _vk_batch = batch
+
+def _vk_wall(domain: str) -> list[dict]:
+    items = _vk_batch.get(domain.lower())
+    if items is not None:
+        return items
+    with _guard("vk_group:api"):
+        r = S.get_hedged(f"{VK_API}/wall.get", params={
+            "domain": domain, "count": VK_WALL_COUNT,
+            "access_token": config.VK_SERVICE_TOKEN, "v": VK_API_VERSION,
+        }, timeout=10)
+        transport.raise_for_outage(r)
+        data = r.json()
+    return data.get("response", {}).get("items", [])
+
+def check_vk_group(url: str) -> StreamStatus:
     domain = _slug(url)
     if not domain:
-        return False
+        return StreamStatus(False)
     try:
-        r = requests.get("https://api.vk.com/method/wall.get", params={
-            "domain": domain, "count": 5,
-            "access_token": config.VK_SERVICE_TOKEN, "v": "5.199",
-        }, timeout=10)
-        items = r.json().get("response", {}).get("items", [])
-        for post in items:
-            text = post.get("text", "")
-            attachments = post.get("attachments", [])
-            extra = " ".join(a.get("link", {}).get("url", "")
-                             for a in attachments if a.get("type") == "link")
-            inline = " ".join(re.findall(r'https?://\S+', text))
-            if _is_stream_post(text + " " + extra + " " + inline):
-                return True
+        items = _vk_wall(domain)
+        source = f"vk_group:{domain.lower()}"
+        cursor = _feed_cursor(source)
+        # Закреплённый пост идёт первым, но старые id отсекает курсор
+        posts = sorted((p["id"], p.get("date"), _vk_post_text(p))
+                       for p in items if p.get("id", 0) > cursor[0])
+        return _feed_scan(source, cursor, posts, "api")
+    except breaker.OpenError:
+        pass
     except Exception as e:
         log.error("VK group: %s", e)
-    return False
+    return _unknown()
 
 
 # ─── Длительность (универсальная) ─────────────────────────────
 
+DURATION_SECONDS = metrics.Histogram(
+    "checker_duration_lookup_seconds", "Время get_stream_duration", ("platform",))
+
 def get_stream_duration(platform: str, url: str) -> int:
     """Возвращает минуты текущего стрима. 0 если неизвестно."""
     funcs = {
@@ -331,7 +879,8 @@ def get_stream_duration(platform: str, url: str) -> int:
     fn = funcs.get(platform)
     if fn:
         try:
-            return fn(url)
+            with DURATION_SECONDS.time(platform):
+                return fn(url)
         except Exception as e:
             log.error("duration %s: %s", platform, e)
     return 0
@@ -348,16 +897,155 @@ PLATFORMS = [
     ("vk_group", "💙 ВКонтакте",    check_vk_group,  lambda s: s.get("vk_group", "")),
 ]
 
-def check_streamer(streamer: dict) -> list[dict]:
-    results = []
+# Каждая пара (стример, площадка) — отдельная задача в пуле своей
+# площадки: одновременных запросов к ней не больше CHECK_PER_HOST
+# (rate limit, бан), а медленная площадка занимает только свои потоки —
+# остальные проверяются, не стоя за ней в очереди.
+# Общий пул _pool — для пакетных запросов перед циклом (_prefetch).
+_pool = ThreadPoolExecutor(max_workers=config.CHECK_WORKERS,
+                           thread_name_prefix="probe")
+# Сами пакеты площадок идут одновременно, каждый в своём потоке: им
+# нужен _pool, и ждать его из его же потоков нельзя
+_prefetch_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="prefetch")
+_host_pools: dict[str, ThreadPoolExecutor] = {}
+_host_lock = threading.Lock()
+
+def _pool_map(fn, items) -> list:
+    """
+    _pool.map под сроком вызывающего потока: transport.deadline
+    хранится в потоке и сам в задачи пула не переходит.
+    """
+    at = transport.current_deadline()
+
+    def call(item):
+        with transport.deadline(at):
+            return fn(item)
+    return list(_pool.map(call, items))
+
+def _host_pool(pid: str) -> ThreadPoolExecutor:
+    with _host_lock:
+        pool = _host_pools.get(pid)
+        if pool is None:
+            pool = _host_pools[pid] = ThreadPoolExecutor(
+                max_workers=config.CHECK_PER_HOST, thread_name_prefix=f"probe-{pid}")
+        return pool
+
+PROBE_SECONDS = metrics.Histogram(
+    "checker_probe_seconds", "Время одной проверки площадки (check_*)", ("platform",))
+PROBES = metrics.Counter(
+    "checker_probes_total", "Проверки по источнику ответа: api, html, unknown", ("platform", "source"))
+CARRIED = metrics.Counter(
+    "checker_probes_carried_total", "Проверки, не успевшие к концу цикла")
+
+def _probe(streamer: dict, pid: str, icon: str, fn, url: str) -> dict:
+    budget = config.CHECK_INTERVAL_SECONDS * config.CHECK_PROBE_SHARE
+    # Срок отсчитывается с момента, когда дошла очередь до площадки
+    with transport.deadline(time.monotonic() + budget):
+        started = time.perf_counter()
+        try:
+            status = fn(url)
+        except Exception as e:
+            log.error("check %s/%s: %s", streamer["id"], pid, e)
+            status = _unknown()
+        PROBE_SECONDS.observe(time.perf_counter() - started, pid)
+    PROBES.inc(pid, status.source or "none")
+    # is_live=None — площадка недоступна, прошлое состояние не трогаем
+    return {"platform": pid, "icon": icon, "is_live": status.is_live,
+            "status": status, "url": url}
+
+def _prefetch(streamers: list[dict], only: set | None):
+    """Пакетные запросы к API — один раз на цикл для всех стримеров."""
+    def urls(pid: str) -> list[str]:
+        return [s.get(pid, "") for s in streamers
+                if only is None or (s["id"], pid) in only]
+    # Одновременно, а не друг за другом: срок у пакетов общий, и
+    # последнему в очереди от него ничего бы не осталось
+    at = transport.current_deadline()
+
+    def run(fn, items):
+        with transport.deadline(at):
+            fn(items)
+    jobs = [_prefetch_pool.submit(run, _tw_prefetch, [_slug(u) for u in urls("twitch")]),
+            _prefetch_pool.submit(run, _vk_prefetch, [_slug(u) for u in urls("vk_group")]),
+            _prefetch_pool.submit(run, _yt_prefetch, urls("youtube"))]
+    for job in jobs:
+        job.result()
+
+# Проверки, не успевшие к концу своего цикла: (streamer_id, platform) → future.
+# Следующий цикл забирает их результат, а не запускает проверку заново.
+_inflight: dict[tuple[str, str], Future] = {}
+_inflight_lock = threading.Lock()
+
+def pending() -> int:
+    """Сколько проверок прошлых циклов ещё не забрано вызовом check_all."""
+    with _inflight_lock:
+        return len(_inflight)
+
+metrics.Gauge("checker_inflight_probes", "Проверки, ещё идущие с прошлых циклов",
+              fn=pending)
+
+def plan(streamer: dict) -> list[tuple[str, str, object, str]]:
+    """
+    Что проверять у стримера: [(platform, icon, check_fn, url)] —
+    только площадки со ссылкой, в порядке PLATFORMS. Заодно разбирает
+    ссылки (slug, ключ канала YouTube), чтобы цикл брал их из кэша.
+    """
+    result = []
     for pid, icon, fn, get_url in PLATFORMS:
         url = get_url(streamer)
         if not url:
             continue
-        try:
-            live = fn(url)
-        except Exception as e:
-            log.error("check %s/%s: %s", streamer["id"], pid, e)
-            live = False
-        results.append({"platform": pid, "icon": icon, "is_live": live, "url": url})
+        if pid == "youtube":
+            _yt_channel_key(url)
+        else:
+            _slug(url)
+        result.append((pid, icon, fn, url))
+    return result
+
+def check_all(streamers: list[dict],
+              only: set[tuple[str, str]] | None = None,
+              plans: dict[str, list] | None = None) -> dict[str, list[dict]]:
+    """
+    Проверить стримеров параллельно, не дольше CHECK_CYCLE_SHARE
+    от CHECK_INTERVAL_SECONDS.
+    only — проверить только эти пары (streamer_id, platform).
+    plans — готовые plan() по streamer_id (registry); чего нет — считается.
+    Возвращает {streamer_id: [результат по каждой площадке]} —
+    порядок площадок тот же, что в PLATFORMS. Не успевшие проверки
+    в результат не попадают; их результат вернёт следующий вызов,
+    даже если пары нет в его only и стримера нет в streamers.
+    """
+    cycle_deadline = (time.monotonic() +
+                      config.CHECK_INTERVAL_SECONDS * config.CHECK_CYCLE_SHARE)
+    if streamers:
+        prefetch_deadline = min(cycle_deadline, time.monotonic() +
+                                config.CHECK_INTERVAL_SECONDS * config.CHECK_PREFETCH_SHARE)
+        with transport.deadline(prefetch_deadline):
+            _prefetch(streamers, only)
+    with _inflight_lock:
+        for streamer in streamers:
+            steps = plans.get(streamer["id"]) if plans is not None else None
+            for pid, icon, fn, url in plan(streamer) if steps is None else steps:
+                key = (streamer["id"], pid)
+                if (only is not None and key not in only) or key in _inflight:
+                    continue
+                _inflight[key] = _host_pool(pid).submit(_probe, streamer, pid, icon, fn, url)
+        jobs = dict(_inflight)
+    wait(jobs.values(), timeout=max(0.0, cycle_deadline - time.monotonic()))
+
+    order = {pid: i for i, (pid, *_) in enumerate(PLATFORMS)}
+    results: dict[str, list[dict]] = {s["id"]: [] for s in streamers}
+    with _inflight_lock:
+        for key in sorted(jobs, key=lambda k: order[k[1]]):
+            fut = jobs[key]
+            if fut.done():
+                del _inflight[key]
+                results.setdefault(key[0], []).append(fut.result())
+        carried = len(_inflight)
+    if carried:
+        CARRIED.inc(n=carried)
+        log.warning("check cycle over budget: %d probes carried over", carried)
     return results
+
+def check_streamer(streamer: dict) -> list[dict]:
+    return check_all([streamer])[streamer["id"]]
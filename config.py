@@ -22,6 +22,8 @@ VK_TOKEN = "vk1.a.M2NzVybh-yEfXDAM5cS0Yv5TawW50Vf40_7JWXuu2kI7ekAQZ27gAM4drtLQPA
 
 # ── 2. ID группы-бота ──────────────────────────────────────────
 # URL группы: vk.com/clubЧИСЛО — это и есть ID
+# Управление → Работа с API → Long Poll API: ✅ включён,
+# Типы событий: ✅ Входящее сообщение
 VK_GROUP_ID = 236231799
 
 # ── 3. Сервисный ключ VK ───────────────────────────────────────
@@ -35,6 +37,9 @@ VK_SERVICE_TOKEN = "989ef03d989ef03d989ef03d1e9ba1f8389989e989ef03df10343c3f897e
 ADMIN_IDS = [0]  # ← замени на свой VK user ID  # например: [12345678]
 
 # ── 5. Список стримеров ────────────────────────────────────────
+# Начальный список: при первом запуске переносится в БД (таблица
+# streamers), дальше его правят админ-командами /add, /set, /del без
+# перезапуска. Правки этого списка после первого запуска не действуют.
 STREAMERS = [
     {
         "id":       "hardplay",
@@ -73,11 +78,98 @@ YOUTUBE_API_KEY = ""
 
 # ── Настройки проверки ─────────────────────────────────────────
 CHECK_INTERVAL_SECONDS = 60    # интервал проверки платформ
+CHECK_WORKERS          = 24    # потоков для пакетных запросов перед циклом
+CHECK_PER_HOST         = 4     # одновременных проверок одной площадки (свой пул)
+# Бюджет времени — доли CHECK_INTERVAL_SECONDS. Цикл ждёт проверки не
+# дольше CHECK_CYCLE_SHARE интервала: не успевшие переходят в следующий
+# цикл и не запускаются заново. Одна проверка (со всеми повторами)
+# укладывается в CHECK_PROBE_SHARE интервала. Пакетные запросы перед
+# циклом — не дольше CHECK_PREFETCH_SHARE: что не успели, проверки
+# запросят сами.
+CHECK_CYCLE_SHARE      = 0.5
+CHECK_PROBE_SHARE      = 0.25
+CHECK_PREFETCH_SHARE   = 0.25
+
+# Адаптивное расписание: CHECK_INTERVAL_SECONDS — базовый интервал,
+# для каждой площадки каждого стримера он подстраивается отдельно
+SCHED_TICK_SECONDS   = 5     # как часто смотреть, кому пора проверяться
+SCHED_HOT_INTERVAL   = 20    # около обычного времени начала стрима
+SCHED_HOT_WINDOW_MIN = 45    # «около» — ± столько минут
+SCHED_LIVE_FACTOR    = 3     # уже в эфире — реже
+SCHED_DORMANT_HOURS  = 72    # не стримил дольше — считается «спящим»
+SCHED_DORMANT_FACTOR = 5     # «спящих» — реже
+SCHED_HISTORY_WEEKS  = 8     # за сколько недель строить гистограмму стартов
+SCHED_HISTORY_MIN    = 4     # меньше эфиров в истории — гистограмме не верим
+SCHED_HOT_SHARE      = 0.15  # доля стартов в этот и следующий час → «горячо»
+SCHED_COLD_FACTOR    = 2     # в часы без стартов по истории — реже
+PLATFORM_MIN_INTERVAL = {    # не чаще, чем раз в N секунд
+    "twitch":   20,
+    "youtube":  30,
+    "kick":     30,
+    "vkplay":   30,
+    "telegram": 60,
+    "vk_group": 60,
+}
+
+# Кэш HTML-страниц: сколько секунд ответ считается свежим
+# (проверка и длительность в одном цикле делят один запрос).
+# После TTL — условный запрос (ETag / Last-Modified).
+# TTL должен быть меньше самого частого опроса (SCHED_HOT_INTERVAL
+# и PLATFORM_MIN_INTERVAL с разбросом −10%), иначе частая проверка
+# перечитает тот же закэшированный ответ.
+HTTP_CACHE_TTL_DEFAULT = 15
+HTTP_CACHE_TTL = {}             # свой TTL для отдельных хостов, {"t.me": 10}
+HTTP_CACHE_MAX_MB = 64         # потолок памяти под тела страниц
+
+# HTTP: таймауты (сек), повторы GET при обрыве / 429 / 5xx
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT    = 15
+HTTP_RETRIES         = 2
+HTTP_RETRY_BACKOFF   = 0.5     # базовая пауза, растёт ×2 с каждой попыткой
+HTTP_RETRY_MAX_SLEEP = 5
+HTTP_POOL_HOSTS      = 32      # скольким хостам держать пулы соединений
+# Запросы к API, ответ на которые задерживается дольше HTTP_HEDGE_PERCENTILE
+# обычной задержки хоста, дублируются — берётся тот ответ, что придёт первым
+HTTP_HEDGE_PERCENTILE  = 0.95
+HTTP_HEDGE_MIN_SAMPLES = 20    # пока замеров меньше — не дублировать
+HTTP_HEDGE_WINDOW      = 200   # сколько последних замеров хранить на хост
+# Подмена хостов для стенда (standin.py / loadtest.py):
+# "kick.com" → "http://127.0.0.1:8800" превращает https://kick.com/x
+# в http://127.0.0.1:8800/kick.com/x. В боевом режиме — пусто.
+HTTP_REWRITE_HOSTS = {}
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics
+# (0 — не поднимать эндпоинт; /metrics в чате работает всегда)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Профилирование по команде /profile N (profiler.py)
+PROFILE_DIR         = "profiles"   # куда сохранять свёрнутые стеки
+PROFILE_INTERVAL    = 0.01         # срез стеков раз в N секунд
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP         = 15           # сколько функций прислать в ответ
+PROFILE_THREADS     = ("checker", "probe", "MainThread", "handler")  # имена / префиксы потоков
+
+# Предохранители площадок (API и HTML — отдельно)
+BREAKER_FAILURES     = 5       # ошибок подряд → перестать ходить на площадку
+BREAKER_ERROR_RATE   = 0.5     # или такая доля ошибок в окне
+BREAKER_WINDOW       = 20      # последних запросов в окне
+BREAKER_SLOW_SECONDS = 8       # ответ медленнее — считается ошибкой
+BREAKER_COOLDOWN     = 30      # первая пауза, сек; дальше ×2
+BREAKER_MAX_COOLDOWN = 600
 
 # Если бот перезапустился и нашёл уже идущий стрим —
 # уведомить только если стрим идёт НЕ ДОЛЬШЕ этого числа минут
 MAX_LATE_NOTIFY_MIN = 30
 
+# Лимит VK на вызовы messages.send от сообщества (в секунду)
+VK_SEND_RPS = 20
+DELIVERY_WORKERS    = 4    # потоков доставки уведомлений
+OUTBOX_MAX_ATTEMPTS = 3    # попыток доставить одно сообщение
+OUTBOX_RETRY_SECONDS     = 15    # пауза перед повтором, дальше ×2
+OUTBOX_RETRY_MAX_SECONDS = 600   # потолок паузы
+HANDLER_WORKERS     = 8    # потоков обработки входящих сообщений
+
 # Ключевые слова для постов в TG и ВК группе
 KEYWORD_MIN_MATCHES = 1
 STREAM_KEYWORDS = {
@@ -88,6 +180,8 @@ STREAM_LINK_DOMAINS = [
     "twitch.tv", "youtube.com/watch", "youtube.com/live",
     "youtu.be", "kick.com", "vkplay.live", "live.vkvideo.ru",
 ]
+# Сколько минут пост о стриме в TG / ВК считается «стрим идёт»
+STREAM_POST_TTL_MIN = 240
 
 
 # ── Тексты сообщений ───────────────────────────────────────────
@@ -1,18 +1,52 @@
 """
 database.py — SQLite: подписки, состояние стримов, статистика
 """
-import sqlite3, os
+import sqlite3, os, statistics, threading, time, zlib
 from datetime import datetime
+import metrics
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "bot.db")
 
+# Ссылки стримера на площадки — колонки таблицы streamers (как ключи в config.STREAMERS)
+STREAMER_LINKS = ("twitch", "youtube", "kick", "vkplay", "telegram", "vk_group")
 
-def _conn():
-    c = sqlite3.connect(DB_PATH)
-    c.row_factory = sqlite3.Row
+# Одно долгоживущее соединение на поток (checker, LongPoll, пул проверок).
+# sqlite3 кэширует подготовленные запросы по тексту SQL, поэтому
+# повторные get_live / set_live не компилируют запрос заново.
+_local = threading.local()
+
+# Время каждого вызова (с ожиданием блокировки) — db_call_seconds{fn}
+DB_SECONDS = metrics.Histogram("db_call_seconds", "Время вызова функций database.py", ("fn",))
+_timed = metrics.timed(DB_SECONDS)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",     # чтение не ждёт запись из другого потока
+    "PRAGMA synchronous=NORMAL",   # в WAL этого достаточно для целостности
+    "PRAGMA cache_size=-8000",     # 8 МБ страничного кэша
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _conn() -> sqlite3.Connection:
+    c = getattr(_local, "conn", None)
+    if c is None or _local.path != DB_PATH:
+        c = sqlite3.connect(DB_PATH, timeout=30, cached_statements=256)
+        c.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            c.execute(pragma)
+        _local.conn, _local.path = c, DB_PATH
     return c
 
 
+def close():
+    """Закрыть соединение текущего потока."""
+    c = getattr(_local, "conn", None)
+    if c is not None:
+        c.close()
+        _local.conn = None
+
+
+@_timed
 def init():
     with _conn() as db:
         db.executescript("""
@@ -28,27 +62,89 @@ def init():
                 is_live     INTEGER NOT NULL DEFAULT 0,
                 PRIMARY KEY (streamer_id, platform)
             );
+            CREATE TABLE IF NOT EXISTS stream_sessions (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                streamer_id TEXT    NOT NULL,
+                platform    TEXT    NOT NULL,
+                started_at  REAL    NOT NULL,
+                detected_at REAL    NOT NULL,
+                ended_at    REAL,
+                latency_sec REAL
+            );
+            CREATE INDEX IF NOT EXISTS stream_sessions_open
+                ON stream_sessions (streamer_id, platform, ended_at);
+            CREATE INDEX IF NOT EXISTS stream_sessions_started
+                ON stream_sessions (started_at);
             CREATE TABLE IF NOT EXISTS users (
                 user_id    INTEGER PRIMARY KEY,
                 first_seen TEXT DEFAULT (datetime('now')),
                 last_seen  TEXT DEFAULT (datetime('now')),
                 blocked    INTEGER DEFAULT 0
             );
+            CREATE TABLE IF NOT EXISTS outbox_events (
+                event      TEXT    PRIMARY KEY,
+                text       TEXT    NOT NULL,
+                random_id  INTEGER NOT NULL,
+                created_at TEXT    DEFAULT (datetime('now'))
+            );
+            CREATE TABLE IF NOT EXISTS outbox (
+                event           TEXT    NOT NULL,
+                user_id         INTEGER NOT NULL,
+                status          INTEGER NOT NULL DEFAULT 0,
+                attempts        INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL    NOT NULL DEFAULT 0,
+                PRIMARY KEY (event, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status);
+            CREATE TABLE IF NOT EXISTS feed_cursors (
+                source       TEXT PRIMARY KEY,
+                last_post_id INTEGER NOT NULL DEFAULT 0,
+                live_post_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS tokens (
+                name       TEXT PRIMARY KEY,
+                value      TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS yt_channels (
+                handle      TEXT PRIMARY KEY,
+                channel_id  TEXT NOT NULL,
+                resolved_at TEXT DEFAULT (datetime('now'))
+            );
+            CREATE TABLE IF NOT EXISTS streamers (
+                id         TEXT    PRIMARY KEY,
+                name       TEXT    NOT NULL,
+                position   INTEGER NOT NULL DEFAULT 0,
+                twitch     TEXT    NOT NULL DEFAULT '',
+                youtube    TEXT    NOT NULL DEFAULT '',
+                kick       TEXT    NOT NULL DEFAULT '',
+                vkplay     TEXT    NOT NULL DEFAULT '',
+                telegram   TEXT    NOT NULL DEFAULT '',
+                vk_group   TEXT    NOT NULL DEFAULT '',
+                updated_at TEXT    DEFAULT (datetime('now'))
+            );
         """)
+        # Колонки, появившиеся после создания таблиц в старых БД
+        columns = {r["name"] for r in db.execute("PRAGMA table_info(outbox)")}
+        if "next_attempt_at" not in columns:
+            db.execute("ALTER TABLE outbox ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
 
 
 # ── Подписки ──────────────────────────────────────────────────
 
+@_timed
 def subscribe(user_id: int, streamer_id: str):
     with _conn() as db:
         db.execute("INSERT OR IGNORE INTO subscriptions VALUES (?,?,datetime('now'))",
                    (user_id, streamer_id))
 
+@_timed
 def unsubscribe(user_id: int, streamer_id: str):
     with _conn() as db:
         db.execute("DELETE FROM subscriptions WHERE user_id=? AND streamer_id=?",
                    (user_id, streamer_id))
 
+@_timed
 def is_subscribed(user_id: int, streamer_id: str) -> bool:
     with _conn() as db:
         return bool(db.execute(
@@ -56,6 +152,7 @@ def is_subscribed(user_id: int, streamer_id: str) -> bool:
             (user_id, streamer_id)
         ).fetchone())
 
+@_timed
 def get_user_subscriptions(user_id: int) -> list[str]:
     with _conn() as db:
         rows = db.execute(
@@ -63,6 +160,7 @@ def get_user_subscriptions(user_id: int) -> list[str]:
         ).fetchall()
     return [r["streamer_id"] for r in rows]
 
+@_timed
 def get_subscribers_of(streamer_id: str) -> list[int]:
     """Подписчики стримера (не заблокированные)."""
     with _conn() as db:
@@ -73,15 +171,18 @@ def get_subscribers_of(streamer_id: str) -> list[int]:
         """, (streamer_id,)).fetchall()
     return [r["user_id"] for r in rows]
 
+@_timed
 def unsubscribe_all(user_id: int):
     with _conn() as db:
         db.execute("DELETE FROM subscriptions WHERE user_id=?", (user_id,))
 
+@_timed
 def get_all_subscribers_count() -> int:
     with _conn() as db:
         row = db.execute("SELECT COUNT(DISTINCT user_id) as c FROM subscriptions").fetchone()
     return row["c"] if row else 0
 
+@_timed
 def get_subscribers_count_by_streamer() -> list[dict]:
     with _conn() as db:
         rows = db.execute("""
@@ -93,6 +194,7 @@ def get_subscribers_count_by_streamer() -> list[dict]:
 
 # ── Пользователи ──────────────────────────────────────────────
 
+@_timed
 def touch_user(user_id: int):
     """Зафиксировать активность пользователя."""
     with _conn() as db:
@@ -103,6 +205,7 @@ def touch_user(user_id: int):
                 blocked   = 0
         """, (user_id,))
 
+@_timed
 def mark_blocked(user_id: int):
     """Пользователь заблокировал бота — не слать ему сообщения."""
     with _conn() as db:
@@ -111,9 +214,126 @@ def mark_blocked(user_id: int):
             ON CONFLICT(user_id) DO UPDATE SET blocked=1
         """, (user_id,))
 
+@_timed
+def mark_blocked_many(user_ids: list[int]):
+    with _conn() as db:
+        db.executemany("""
+            INSERT INTO users (user_id, blocked) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET blocked=1
+        """, [(uid,) for uid in user_ids])
+
+
+# ── Очередь уведомлений ───────────────────────────────────────
+
+# Статусы строк outbox
+OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_DONE, OUTBOX_FAILED = 0, 1, 2, 3
+
+_outbox_lock = threading.Lock()
+
+@_timed
+def outbox_enqueue(event: str, text: str, user_ids: list[int]):
+    """Поставить событие в очередь. Повторный вызов с тем же event не дублирует."""
+    random_id = zlib.crc32(event.encode()) & 0x7FFFFFFF
+    with _conn() as db:
+        db.execute("INSERT OR IGNORE INTO outbox_events (event, text, random_id) VALUES (?,?,?)",
+                   (event, text, random_id))
+        db.executemany("INSERT OR IGNORE INTO outbox (event, user_id) VALUES (?,?)",
+                       [(event, uid) for uid in user_ids])
+
+@_timed
+def outbox_claim(limit: int, live_max_age: float | None = None
+                 ) -> tuple[str, str, int, list[int]] | None:
+    """
+    Забрать пачку получателей одного события: (event, text, random_id, user_ids).
+    Строки помечаются как «отправляется», чтобы их не взял другой поток.
+    Получатели, чей повтор ещё не наступил (next_attempt_at), не берутся.
+    Уведомления о начале эфира (live:…) старше live_max_age секунд
+    уже не нужны — их получатели помечаются неудачными, не отправляясь.
+    """
+    now = time.time()
+    max_age = f"-{live_max_age:.0f} seconds" if live_max_age is not None else None
+    with _outbox_lock, _conn() as db:
+        while True:
+            row = db.execute(
+                "SELECT event FROM outbox WHERE status=? AND next_attempt_at<=? "
+                "ORDER BY rowid LIMIT 1",
+                (OUTBOX_PENDING, now)
+            ).fetchone()
+            if not row:
+                return None
+            event = row["event"]
+            ev = db.execute(
+                "SELECT text, random_id, ? IS NOT NULL AND event LIKE 'live:%' "
+                "AND created_at < datetime('now', ?) AS stale "
+                "FROM outbox_events WHERE event=?",
+                (max_age, max_age, event)).fetchone()
+            if not ev["stale"]:
+                break
+            db.execute("UPDATE outbox SET status=? WHERE event=? AND status=?",
+                       (OUTBOX_FAILED, event, OUTBOX_PENDING))
+        user_ids = [r["user_id"] for r in db.execute(
+            "SELECT user_id FROM outbox WHERE event=? AND status=? AND next_attempt_at<=? LIMIT ?",
+            (event, OUTBOX_PENDING, now, limit)
+        ).fetchall()]
+        db.executemany("UPDATE outbox SET status=? WHERE event=? AND user_id=?",
+                       [(OUTBOX_SENDING, event, uid) for uid in user_ids])
+    return event, ev["text"], ev["random_id"], user_ids
+
+@_timed
+def outbox_finish(event: str, done: list[int], failed: list[int], max_attempts: int,
+                  retry_delay: float, retry_max: float):
+    """
+    Отметить результат пачки. Неудачные вернутся в очередь до
+    max_attempts раз, каждый раз через вдвое большую паузу:
+    retry_delay, 2 × retry_delay, … (не больше retry_max).
+    """
+    with _conn() as db:
+        db.executemany("UPDATE outbox SET status=? WHERE event=? AND user_id=?",
+                       [(OUTBOX_DONE, event, uid) for uid in done])
+        db.executemany("""
+            UPDATE outbox SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END,
+                next_attempt_at = ? + MIN(? * (1 << attempts), ?)
+            WHERE event=? AND user_id=?
+        """, [(max_attempts, OUTBOX_FAILED, OUTBOX_PENDING,
+               time.time(), retry_delay, retry_max, event, uid) for uid in failed])
+
+@_timed
+def outbox_defer(event: str, user_ids: list[int], delay: float):
+    """Вернуть пачку в очередь через delay секунд, не засчитывая попытку."""
+    with _conn() as db:
+        db.executemany("UPDATE outbox SET status=?, next_attempt_at=? WHERE event=? AND user_id=?",
+                       [(OUTBOX_PENDING, time.time() + delay, event, uid) for uid in user_ids])
+
+@_timed
+def outbox_resume():
+    """
+    При старте: пачки, прерванные на отправке, — снова в очередь;
+    доставленные события старше недели — удалить.
+    """
+    with _conn() as db:
+        db.execute("UPDATE outbox SET status=? WHERE status=?",
+                   (OUTBOX_PENDING, OUTBOX_SENDING))
+        db.execute("""
+            DELETE FROM outbox WHERE event IN (
+                SELECT event FROM outbox_events WHERE created_at < datetime('now', '-7 days')
+            )
+        """)
+        db.execute("""
+            DELETE FROM outbox_events WHERE created_at < datetime('now', '-7 days')
+        """)
+
+@_timed
+def outbox_pending() -> int:
+    with _conn() as db:
+        row = db.execute("SELECT COUNT(*) AS c FROM outbox WHERE status IN (?,?)",
+                         (OUTBOX_PENDING, OUTBOX_SENDING)).fetchone()
+    return row["c"]
+
 
 # ── Состояние стримов ─────────────────────────────────────────
 
+@_timed
 def get_live(streamer_id: str, platform: str) -> bool:
     with _conn() as db:
         row = db.execute(
@@ -122,9 +342,209 @@ def get_live(streamer_id: str, platform: str) -> bool:
         ).fetchone()
     return bool(row["is_live"]) if row else False
 
+@_timed
 def set_live(streamer_id: str, platform: str, is_live: bool):
     with _conn() as db:
         db.execute("""
             INSERT INTO stream_state (streamer_id, platform, is_live) VALUES (?,?,?)
             ON CONFLICT(streamer_id, platform) DO UPDATE SET is_live=excluded.is_live
         """, (streamer_id, platform, int(is_live)))
+
+@_timed
+def get_live_states() -> dict[tuple[str, str], bool]:
+    """Всё состояние стримов: (streamer_id, platform) → в эфире."""
+    with _conn() as db:
+        rows = db.execute(
+            "SELECT streamer_id, platform, is_live FROM stream_state"
+        ).fetchall()
+    return {(r["streamer_id"], r["platform"]): bool(r["is_live"]) for r in rows}
+
+@_timed
+def save_transitions(changes: list[tuple[str, str, bool]],
+                     started: list[tuple[str, str, float, float]] = (),
+                     ended: list[tuple[str, str, float]] = ()):
+    """
+    Итог цикла одной транзакцией:
+      changes — (streamer_id, platform, is_live) для stream_state;
+      started — (streamer_id, platform, started_at, detected_at) новых эфиров;
+      ended   — (streamer_id, platform, ended_at) закончившихся.
+    """
+    with _conn() as db:
+        db.executemany("""
+            INSERT INTO stream_state (streamer_id, platform, is_live) VALUES (?,?,?)
+            ON CONFLICT(streamer_id, platform) DO UPDATE SET is_live=excluded.is_live
+        """, [(sid, pid, int(live)) for sid, pid, live in changes])
+        db.executemany("""
+            UPDATE stream_sessions SET ended_at=?
+            WHERE streamer_id=? AND platform=? AND ended_at IS NULL
+        """, [(at, sid, pid) for sid, pid, at in ended])
+        db.executemany("""
+            INSERT INTO stream_sessions
+                (streamer_id, platform, started_at, detected_at, latency_sec)
+            VALUES (?,?,?,?,?)
+        """, [(sid, pid, start, detected, detected - start if start < detected else None)
+              for sid, pid, start, detected in started])
+
+
+# ── История эфиров ────────────────────────────────────────────
+
+@_timed
+def start_histograms(weeks: int) -> dict[str, list[int]]:
+    """
+    Недельная гистограмма стартов за последние weeks недель:
+    streamer_id → 168 ячеек (день недели × 24 + час, местное время, пн = 0).
+    Один эфир на нескольких площадках сразу — один старт: сессии
+    стримера считаются не больше одной на час.
+    """
+    since = time.time() - weeks * 7 * 86400
+    with _conn() as db:
+        rows = db.execute("""
+            SELECT streamer_id, MIN(started_at) AS started_at FROM stream_sessions
+            WHERE started_at >= ?
+            GROUP BY streamer_id, CAST(started_at / 3600 AS INTEGER)
+        """, (since,)).fetchall()
+    hist: dict[str, list[int]] = {}
+    for r in rows:
+        t = datetime.fromtimestamp(r["started_at"])
+        hist.setdefault(r["streamer_id"], [0] * 168)[t.weekday() * 24 + t.hour] += 1
+    return hist
+
+@_timed
+def last_live_times() -> dict[tuple[str, str], float]:
+    """
+    (streamer_id, platform) → когда эфир был виден последний раз:
+    конец последней сессии, а у незакрытой — когда её обнаружили.
+    """
+    with _conn() as db:
+        rows = db.execute("""
+            SELECT streamer_id, platform, MAX(COALESCE(ended_at, detected_at)) AS at
+            FROM stream_sessions GROUP BY streamer_id, platform
+        """).fetchall()
+    return {(r["streamer_id"], r["platform"]): r["at"] for r in rows}
+
+@_timed
+def detection_latency(days: int) -> dict[str, tuple[float, int]]:
+    """platform → (медиана задержки обнаружения в секундах, число эфиров)."""
+    since = time.time() - days * 86400
+    with _conn() as db:
+        rows = db.execute("""
+            SELECT platform, latency_sec FROM stream_sessions
+            WHERE started_at >= ? AND latency_sec IS NOT NULL
+        """, (since,)).fetchall()
+    by_platform: dict[str, list[float]] = {}
+    for r in rows:
+        by_platform.setdefault(r["platform"], []).append(r["latency_sec"])
+    return {pid: (statistics.median(v), len(v)) for pid, v in by_platform.items()}
+
+
+# ── Курсоры лент (TG / ВК) ────────────────────────────────────
+
+@_timed
+def get_feed_cursor(source: str) -> tuple[int, float | None]:
+    """(id последнего просмотренного поста, время последнего поста о стриме)."""
+    with _conn() as db:
+        row = db.execute(
+            "SELECT last_post_id, live_post_at FROM feed_cursors WHERE source=?",
+            (source,)
+        ).fetchone()
+    return (row["last_post_id"], row["live_post_at"]) if row else (0, None)
+
+@_timed
+def set_feed_cursor(source: str, last_post_id: int, live_post_at: float | None):
+    with _conn() as db:
+        db.execute("""
+            INSERT INTO feed_cursors (source, last_post_id, live_post_at) VALUES (?,?,?)
+            ON CONFLICT(source) DO UPDATE SET
+                last_post_id = excluded.last_post_id,
+                live_post_at = excluded.live_post_at
+        """, (source, last_post_id, live_post_at))
+
+
+# ── Токены API ────────────────────────────────────────────────
+
+@_timed
+def get_token(name: str) -> tuple[str, float] | None:
+    """(токен, unix-время истечения) или None."""
+    with _conn() as db:
+        row = db.execute(
+            "SELECT value, expires_at FROM tokens WHERE name=?", (name,)
+        ).fetchone()
+    return (row["value"], row["expires_at"]) if row else None
+
+@_timed
+def set_token(name: str, value: str, expires_at: float):
+    with _conn() as db:
+        db.execute("""
+            INSERT INTO tokens (name, value, expires_at) VALUES (?,?,?)
+            ON CONFLICT(name) DO UPDATE SET
+                value      = excluded.value,
+                expires_at = excluded.expires_at
+        """, (name, value, expires_at))
+
+
+# ── Кэш YouTube ───────────────────────────────────────────────
+
+@_timed
+def get_yt_channels() -> dict[str, str]:
+    """@handle / c/name / user/name → UC… (уже найденные ID каналов)."""
+    with _conn() as db:
+        rows = db.execute("SELECT handle, channel_id FROM yt_channels").fetchall()
+    return {r["handle"]: r["channel_id"] for r in rows}
+
+@_timed
+def set_yt_channel(handle: str, channel_id: str):
+    with _conn() as db:
+        db.execute("""
+            INSERT INTO yt_channels (handle, channel_id) VALUES (?,?)
+            ON CONFLICT(handle) DO UPDATE SET
+                channel_id  = excluded.channel_id,
+                resolved_at = datetime('now')
+        """, (handle, channel_id))
+
+
+# ── Стримеры ──────────────────────────────────────────────────
+
+@_timed
+def get_streamers() -> list[dict]:
+    """Все стримеры в порядке показа: {"id", "name", <площадка>: ссылка, …}."""
+    with _conn() as db:
+        rows = db.execute(
+            "SELECT id, name, " + ", ".join(STREAMER_LINKS) +
+            " FROM streamers ORDER BY position, id"
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+@_timed
+def seed_streamers(streamers: list[dict]) -> int:
+    """Перенести начальный список (config.STREAMERS), если таблица пуста."""
+    with _conn() as db:
+        if db.execute("SELECT 1 FROM streamers LIMIT 1").fetchone():
+            return 0
+        db.executemany(
+            "INSERT INTO streamers (id, name, position, " + ", ".join(STREAMER_LINKS) +
+            ") VALUES (?,?,?" + ",?" * len(STREAMER_LINKS) + ")",
+            [(s["id"], s.get("name") or s["id"], i, *(s.get(f, "") for f in STREAMER_LINKS))
+             for i, s in enumerate(streamers)])
+    return len(streamers)
+
+@_timed
+def save_streamer(streamer: dict):
+    """Добавить стримера (в конец списка) или обновить имя и ссылки."""
+    with _conn() as db:
+        db.execute(
+            "INSERT INTO streamers (id, name, position, " + ", ".join(STREAMER_LINKS) + ") "
+            "VALUES (?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM streamers)"
+            + ",?" * len(STREAMER_LINKS) + ") "
+            "ON CONFLICT(id) DO UPDATE SET name = excluded.name, "
+            + ", ".join(f"{f} = excluded.{f}" for f in STREAMER_LINKS) +
+            ", updated_at = datetime('now')",
+            (streamer["id"], streamer["name"], *(streamer.get(f, "") for f in STREAMER_LINKS)))
+
+@_timed
+def delete_streamer(streamer_id: str) -> bool:
+    """Удалить стримера вместе с подписками и состоянием стримов."""
+    with _conn() as db:
+        cur = db.execute("DELETE FROM streamers WHERE id=?", (streamer_id,))
+        db.execute("DELETE FROM subscriptions WHERE streamer_id=?", (streamer_id,))
+        db.execute("DELETE FROM stream_state WHERE streamer_id=?", (streamer_id,))
+    return cur.rowcount > 0
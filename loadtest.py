@@ -0,0 +1,170 @@
+"""
+loadtest.py — нагрузочный прогон цикла проверок на стенде (standin.py).
+Запуск: python loadtest.py [--streamers 10000] [--duration 300] [--latency 80]
+
+Поднимает стенд в этом же процессе, направляет на него все запросы
+(config.HTTP_REWRITE_HOSTS), создаёт N синтетических стримеров со всеми
+площадками и гоняет bot._do_checks так же, как check_loop, на временной
+БД. В конце — время цикла, запросы в секунду, память и задержка
+обнаружения эфиров, начавшихся во время прогона.
+
+Чтобы за несколько минут увидеть и старты, и концы эфиров, задайте
+короткие --mean-live / --mean-offline и --interval: интервалы
+расписания масштабируются вместе с CHECK_INTERVAL_SECONDS.
+"""
+import sys, os, argparse, logging, resource, statistics, tempfile, threading, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import database as db
+import standin
+
+G = "\033[92m"   # зелёный
+R = "\033[91m"   # красный
+B = "\033[1m"    # жирный
+X = "\033[0m"    # сброс
+
+SEP = "─" * 55
+
+PLATFORM_URLS = {
+    "twitch":   "https://www.twitch.tv/{}",
+    "youtube":  "https://www.youtube.com/channel/UC{:_<22}",
+    "kick":     "https://kick.com/{}",
+    "vkplay":   "https://live.vkvideo.ru/{}",
+    "telegram": "https://t.me/{}",
+    "vk_group": "https://vk.com/{}",
+}
+
+
+def streamers(n: int, platforms: list[str]) -> list[dict]:
+    result = []
+    for i in range(n):
+        sid = f"s{i}"
+        s = {"id": sid, "name": f"Стример {i}"}
+        for pid in platforms:
+            s[pid] = PLATFORM_URLS[pid].format(sid)
+        result.append(s)
+    return result
+
+def configure(args, server: standin.StandIn):
+    """Настройки бота под прогон — до импорта checker/bot (пулы создаются при импорте)."""
+    config.STREAMERS = streamers(args.streamers, args.platforms)
+    config.HTTP_REWRITE_HOSTS = server.rewrite_map()
+    config.TWITCH_CLIENT_ID = config.TWITCH_CLIENT_SECRET = "standin"
+    config.YOUTUBE_API_KEY = "standin"
+    config.CHECK_WORKERS = args.workers
+    config.CHECK_PER_HOST = args.per_host
+    scale = args.interval / config.CHECK_INTERVAL_SECONDS
+    config.CHECK_INTERVAL_SECONDS = args.interval
+    config.SCHED_HOT_INTERVAL = max(1, int(config.SCHED_HOT_INTERVAL * scale))
+    config.PLATFORM_MIN_INTERVAL = {pid: max(1, int(v * scale))
+                                    for pid, v in config.PLATFORM_MIN_INTERVAL.items()}
+    config.SCHED_TICK_SECONDS = args.tick
+    config.HTTP_CACHE_TTL_DEFAULT = config.HTTP_CACHE_TTL_DEFAULT * scale
+    config.HTTP_CACHE_TTL = {host: ttl * scale for host, ttl in config.HTTP_CACHE_TTL.items()}
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "bot.db")
+
+
+def percentile(values: list[float], p: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+def run():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--streamers", type=int, default=10000)
+    ap.add_argument("--platforms", default=",".join(PLATFORM_URLS),
+                    help="площадки через запятую")
+    ap.add_argument("--duration", type=float, default=300, help="длительность прогона, сек")
+    ap.add_argument("--interval", type=int, default=config.CHECK_INTERVAL_SECONDS,
+                    help="CHECK_INTERVAL_SECONDS на время прогона")
+    ap.add_argument("--tick", type=float, default=config.SCHED_TICK_SECONDS)
+    ap.add_argument("--workers", type=int, default=config.CHECK_WORKERS)
+    ap.add_argument("--per-host", type=int, default=config.CHECK_PER_HOST)
+    ap.add_argument("--latency", type=float, default=50, help="средняя задержка стенда, мс")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    ap.add_argument("--mean-live", type=float, default=600, help="средняя длина эфира, сек")
+    ap.add_argument("--mean-offline", type=float, default=1800, help="средняя пауза, сек")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--tracemalloc", action="store_true",
+                    help="пик памяти Python-объектов (медленнее)")
+    args = ap.parse_args()
+    args.platforms = [p for p in args.platforms.split(",") if p]
+
+    server = standin.start(0, args.latency / 1000, args.error_rate,
+                           args.mean_live, args.mean_offline, args.seed)
+    configure(args, server)
+
+    import transport
+    import bot       # после configure: пулы и сессии берут новые настройки
+    logging.getLogger().setLevel(logging.WARNING)
+
+    requests_by_status: dict[str, int] = {}
+    stats_lock = threading.Lock()
+
+    def count(method, host, status, elapsed, error):
+        key = str(status) if status else type(error).__name__
+        with stats_lock:
+            requests_by_status[key] = requests_by_status.get(key, 0) + 1
+    transport.add_hook(count)
+
+    probes = [0]
+    check_all = bot.chk.check_all
+
+    def counting_check_all(*a, **kw):
+        results = check_all(*a, **kw)
+        probes[0] += sum(len(r) for r in results.values())
+        return results
+    bot.chk.check_all = counting_check_all
+
+    db.init()
+    if args.tracemalloc:
+        tracemalloc.start()
+    print(f"{B}Стенд {server.base_url}: {args.streamers} стримеров × "
+          f"{len(args.platforms)} площадок, {args.duration:.0f} с{X}")
+
+    cycles: list[float] = []
+    started = time.time()
+    stop_at = time.monotonic() + args.duration
+    while time.monotonic() < stop_at:
+        t = time.perf_counter()
+        bot._do_checks()
+        cycles.append(time.perf_counter() - t)
+        if len(cycles) % 10 == 0:
+            print(f"  {time.time() - started:6.0f} с: циклов {len(cycles)}, "
+                  f"проверок {probes[0]}, запросов {server.requests}")
+        time.sleep(config.SCHED_TICK_SECONDS)
+    elapsed = time.time() - started
+
+    busy = [c for c in cycles if c > 0.001]   # тики, когда было что проверять
+    total_requests = sum(requests_by_status.values())
+    print(f"\n{B}{SEP}{X}")
+    print(f"Циклов: {len(cycles)} (с проверками: {len(busy)})")
+    if busy:
+        print(f"Время цикла: p50 {percentile(busy, 50):.2f} с, p95 {percentile(busy, 95):.2f} с, "
+              f"макс {max(busy):.2f} с")
+    print(f"Проверок: {probes[0]} ({probes[0] / elapsed:.1f}/с)")
+    print(f"Запросов: {total_requests} ({total_requests / elapsed:.1f}/с), "
+          f"на стенде: {server.requests}")
+    print("  по ответам: " + ", ".join(f"{k}: {v}" for k, v in sorted(requests_by_status.items())))
+    print("  по хостам:  " + ", ".join(f"{k}: {v}" for k, v in sorted(server.by_host.items())))
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Память: пик RSS {rss:.0f} МиБ", end="")
+    if args.tracemalloc:
+        print(f", пик Python {tracemalloc.get_traced_memory()[1] / 2 ** 20:.0f} МиБ", end="")
+    print()
+
+    latency = db.detection_latency(elapsed / 86400)
+    if latency:
+        print("Задержка обнаружения (медиана):")
+        for pid, (median, n) in sorted(latency.items()):
+            color = G if median <= config.CHECK_INTERVAL_SECONDS else R
+            print(f"  {pid:<8} {color}{median:6.1f} с{X} ({n} эфиров)")
+    else:
+        print("Эфиров, начавшихся во время прогона, не обнаружено — "
+              "увеличьте --duration или уменьшите --mean-offline")
+    print(f"{B}{SEP}{X}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    run()
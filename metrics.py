@@ -0,0 +1,247 @@
+"""
+metrics.py — счётчики и гистограммы времени для мониторинга.
+
+Модули заводят метрики на уровне модуля и обновляют их на месте:
+    PROBES = metrics.Counter("checker_probes_total", "…", ("platform", "source"))
+    PROBES.inc("kick", "api")
+    with PROBE_SECONDS.time("kick"): …
+
+Всё доступно в текстовом формате Prometheus на
+http://METRICS_HOST:METRICS_PORT/metrics (serve()) и коротким отчётом
+в админ-команде /metrics. Метрика без меток — просто без аргументов.
+"""
+import bisect, functools, logging, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+log = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию, секунды: от 5 мс до 2 минут
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry: list = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _labelstr(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, n: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def values(self) -> dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, v in sorted(self.values().items()):
+            lines.append(f"{self.name}{self._labelstr(labels)} {v:g}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. fn — функция, которая вызывается при каждом
+    чтении и возвращает число (метрика без меток) или {метки: число}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self) -> dict[tuple, float]:
+        if self._fn is not None:
+            data = self._fn()
+            return data if isinstance(data, dict) else {(): data}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        try:
+            values = self.values()
+        except Exception as e:
+            log.debug("gauge %s: %s", self.name, e)
+            return lines
+        for labels, v in sorted(values.items()):
+            lines.append(f"{self.name}{self._labelstr(labels)} {v:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._data: dict[tuple, list] = {}   # метки → [счётчики корзин…, +Inf], сумма
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._data.get(labels)
+            if data is None:
+                data = self._data[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][i] += 1
+            data[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            data = self._data.get(labels)
+            return sum(data[0]) if data else 0
+
+    def label_sets(self) -> list[tuple]:
+        with self._lock:
+            return list(self._data)
+
+    def quantile(self, q: float, *labels) -> float | None:
+        """Оценка квантиля по корзинам (линейно внутри корзины)."""
+        with self._lock:
+            data = self._data.get(labels)
+            counts = list(data[0]) if data else []
+        total = sum(counts)
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lo = self.buckets[i - 1] if i else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._data.items())
+        for labels, (counts, total) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = 'le="%s"' % le
+                lines.append(f"{self.name}_bucket{self._labelstr(labels, le_label)} {acc}")
+            lines.append(f"{self.name}_sum{self._labelstr(labels)} {total:g}")
+            lines.append(f"{self.name}_count{self._labelstr(labels)} {acc}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def timed(hist: Histogram):
+    """Декоратор: время каждого вызова в hist с меткой — именем функции."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - started, fn.__name__)
+        return inner
+    return wrap
+
+
+# ─── HTTP-запросы (хук transport) ─────────────────────────────
+
+HTTP_REQUESTS = Counter("http_requests_total", "Исходящие HTTP-запросы",
+                        ("host", "status"))
+HTTP_SECONDS = Histogram("http_request_seconds", "Время исходящего HTTP-запроса",
+                         ("host",))
+
+def http_hook(method, host, status, elapsed, error):
+    """Для transport.add_hook."""
+    HTTP_REQUESTS.inc(host, str(status) if status else "error")
+    HTTP_SECONDS.observe(elapsed, host)
+
+
+# ─── Вывод ────────────────────────────────────────────────────
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve() -> ThreadingHTTPServer | None:
+    """Запустить HTTP-эндпоинт в фоне (METRICS_PORT = 0 — выключено)."""
+    if not config.METRICS_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), _Handler)
+    except OSError as e:
+        log.error("metrics: не удалось занять порт %s: %s", config.METRICS_PORT, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Metrics on http://%s:%d/metrics", config.METRICS_HOST, config.METRICS_PORT)
+    return server
@@ -0,0 +1,136 @@
+"""
+profiler.py — профилирование работающего бота по команде (/profile N).
+
+Семплирующий профилировщик: отдельный поток раз в PROFILE_INTERVAL
+секунд снимает стеки нужных потоков через sys._current_frames() —
+проверки (checker и пул probe-*) и Long Poll (главный поток и
+handler-*). Профилируемый код ничем не обёрнут: пока профилирование
+выключено, потока нет и накладных расходов нет вовсе.
+
+Время — «настенное»: ожидание сети и блокировок тоже видно, а это
+обычно и есть ответ на вопрос «куда уходит цикл». Потоки пулов,
+которые просто ждут задачу, не учитываются.
+
+Результат — файл свёрнутых стеков (формат flamegraph.pl / speedscope)
+в PROFILE_DIR и топ функций по собственному и полному времени.
+"""
+import logging, os, sys, threading, time
+from collections import Counter
+import config
+
+log = logging.getLogger(__name__)
+
+_running = threading.Lock()
+
+# Стеки простаивающих потоков пулов (ждут задачу) — в профиль не идут
+_IDLE = (
+    "thread.py:_worker",               # ThreadPoolExecutor без задачи
+    "bot.py:_worker;queue.py:get;",    # обработчик ждёт сообщение
+)
+
+
+# Файлы бота: «собственное» время библиотечной функции приписывается
+# ближайшему вызвавшему её коду бота — threading.py:wait сам по себе
+# ничего не говорит, а checker.py:_probe → threading.py:wait говорит
+_PROJECT = {f for f in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+            if f.endswith(".py")}
+
+def _wanted(name: str) -> bool:
+    return any(name == p or name.startswith(p) for p in config.PROFILE_THREADS)
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _group(thread_name: str) -> str:
+    """probe_3 / handler-5 → probe / handler: потоки одного пула в один стек."""
+    return thread_name.rstrip("0123456789").rstrip("-_") or thread_name
+
+
+def _sample(seconds: float, interval: float) -> tuple[Counter, int]:
+    stacks: Counter = Counter()
+    samples = 0
+    me = threading.get_ident()
+    stop_at = time.monotonic() + seconds
+    while time.monotonic() < stop_at:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        frames = sys._current_frames()
+        for ident, frame in frames.items():
+            name = names.get(ident, "")
+            if ident == me or not _wanted(name):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(_group(name))
+            joined = ";".join(reversed(stack))
+            if not (joined.endswith(_IDLE[0]) or _IDLE[1] in joined):
+                stacks[joined] += 1
+        samples += 1
+        del frames   # не держать кадры чужих потоков до следующего среза
+        time.sleep(interval)
+    return stacks, samples
+
+
+def _write(stacks: Counter) -> str:
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(config.PROFILE_DIR,
+                        time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def top(stacks: Counter, n: int) -> list[tuple[str, int, int]]:
+    """(функция, собственные семплы, семплы со вложенными) — по собственным."""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]   # первый элемент — поток
+        if not frames:
+            continue
+        leaf = frames[-1]
+        if leaf.split(":")[0] not in _PROJECT:
+            caller = next((f for f in reversed(frames) if f.split(":")[0] in _PROJECT), None)
+            if caller:
+                leaf = f"{caller} → {leaf}"
+        own[leaf] += count
+        for fn in set(frames):
+            total[fn] += count
+    return [(fn, c, total[fn.split(" → ")[0]]) for fn, c in own.most_common(n)]
+
+
+def report(stacks: Counter, samples: int, path: str, n: int) -> str:
+    hits = sum(stacks.values())
+    if not hits:
+        return "Профилировщик: нужные потоки не найдены."
+    lines = [f"🔬 Профиль: {samples} срезов, файл {path}\n",
+             "собств. / всего — функция"]
+    for fn, own, total in top(stacks, n):
+        lines.append(f"{own * 100 / hits:5.1f}% / {total * 100 / hits:5.1f}% — {fn}")
+    return "\n".join(lines)
+
+
+def start(seconds: float, on_done) -> bool:
+    """
+    Профилировать seconds секунд в фоне, затем вызвать on_done(текст отчёта).
+    False — профилирование уже идёт.
+    """
+    if not _running.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            stacks, samples = _sample(seconds, config.PROFILE_INTERVAL)
+            path = _write(stacks)
+            log.info("Profile saved: %s (%d samples)", path, samples)
+            on_done(report(stacks, samples, path, config.PROFILE_TOP))
+        except Exception as e:
+            log.error("profiler: %s", e)
+            on_done(f"Профилировщик упал: {e}")
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    return True
@@ -0,0 +1,136 @@
+"""
+registry.py — список стримеров: таблица streamers в БД и индексы в памяти.
+
+При первом запуске таблица заполняется из config.STREAMERS, дальше
+список правят админ-командами (/add, /set, /del, /reload) — без
+перезапуска бота. Каждая правка пишется в БД и пересобирает снимок:
+список в порядке показа, индекс по id, пары (стример, площадка) для
+расписания и готовые планы проверок (checker.plan — разобранные
+ссылки). Снимок не меняется после сборки и подменяется целиком, так
+что поток проверок и обработчики читают current() без блокировок.
+"""
+import logging, re, threading
+from dataclasses import dataclass
+import config, database as db, checker as chk
+
+log = logging.getLogger(__name__)
+
+# Что можно править командой /set
+FIELDS = ("name",) + db.STREAMER_LINKS
+
+# id идёт в payload кнопок и в БД — только латиница, цифры, «_»
+_ID_RE = re.compile(r"^[a-z0-9_]{1,32}$")
+
+
+class RegistryError(ValueError):
+    """Правка отклонена; текст — для ответа админу."""
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    streamers: list[dict]              # в порядке показа
+    by_id: dict[str, dict]
+    position: dict[str, int]           # id → место в списке
+    plans: dict[str, list]             # id → checker.plan()
+    keys: list[tuple[str, str]]        # пары (id, площадка) для расписания
+
+
+_snap: Snapshot | None = None
+_lock = threading.RLock()     # правки и перезагрузки — по одной
+_listeners: list = []
+
+
+def _build(streamers: list[dict], version: int) -> Snapshot:
+    plans = {s["id"]: chk.plan(s) for s in streamers}
+    return Snapshot(
+        version=version,
+        streamers=streamers,
+        by_id={s["id"]: s for s in streamers},
+        position={s["id"]: i for i, s in enumerate(streamers)},
+        plans=plans,
+        keys=[(sid, step[0]) for sid, steps in plans.items() for step in steps],
+    )
+
+
+def on_change(fn):
+    """fn(snapshot) после каждой перезагрузки (сброс кэшей клавиатур и т.п.)."""
+    _listeners.append(fn)
+
+
+def reload() -> Snapshot:
+    """Перечитать список из БД и подменить снимок."""
+    global _snap
+    with _lock:
+        snap = _snap = _build(db.get_streamers(), _snap.version + 1 if _snap else 1)
+        for fn in _listeners:
+            try:
+                fn(snap)
+            except Exception as e:
+                log.error("registry listener %s: %s", getattr(fn, "__name__", fn), e)
+    log.info("Registry v%d: %d streamers, %d checks",
+             snap.version, len(snap.streamers), len(snap.keys))
+    return snap
+
+
+def load() -> Snapshot:
+    """Первая загрузка: перенести config.STREAMERS, если таблица пуста."""
+    with _lock:
+        seeded = db.seed_streamers(config.STREAMERS)
+        if seeded:
+            log.info("Registry: %d streamers imported from config", seeded)
+        return reload()
+
+
+def current() -> Snapshot:
+    snap = _snap
+    return snap if snap is not None else load()
+
+
+def streamers() -> list[dict]:
+    return current().streamers
+
+
+def get(streamer_id: str) -> dict | None:
+    return current().by_id.get(streamer_id)
+
+
+# ─── Правки (админ-команды) ───────────────────────────────────
+
+def add(streamer_id: str, name: str) -> Snapshot:
+    streamer_id = streamer_id.lower()
+    if not _ID_RE.match(streamer_id):
+        raise RegistryError("id — латиница, цифры и «_», до 32 символов")
+    name = name.strip()
+    if not name:
+        raise RegistryError("Нужно имя")
+    with _lock:
+        if streamer_id in current().by_id:
+            raise RegistryError(f"Стример {streamer_id} уже есть")
+        db.save_streamer({"id": streamer_id, "name": name})
+        return reload()
+
+
+def set_field(streamer_id: str, field: str, value: str) -> Snapshot:
+    """Имя или ссылка на площадку; «-» вместо ссылки — убрать площадку."""
+    if field not in FIELDS:
+        raise RegistryError("Поле — одно из: " + ", ".join(FIELDS))
+    value = "" if value.strip() == "-" else value.strip()
+    if field == "name" and not value:
+        raise RegistryError("Нужно имя")
+    if field != "name" and value and not value.startswith(("https://", "http://")):
+        raise RegistryError("Ссылка должна начинаться с https://")
+    with _lock:
+        streamer = current().by_id.get(streamer_id)
+        if streamer is None:
+            raise RegistryError(f"Стримера {streamer_id} нет")
+        db.save_streamer({**streamer, field: value})
+        return reload()
+
+
+def remove(streamer_id: str) -> Snapshot:
+    """Удалить стримера вместе с подписками на него."""
+    with _lock:
+        if not db.delete_streamer(streamer_id):
+            raise RegistryError(f"Стримера {streamer_id} нет")
+        return reload()
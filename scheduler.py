@@ -0,0 +1,150 @@
+"""
+scheduler.py — адаптивное расписание проверок.
+
+Вместо опроса всех площадок раз в CHECK_INTERVAL_SECONDS у каждой
+пары (стример, площадка) своё время следующей проверки:
+  • около обычного времени начала стримов — чаще (SCHED_HOT_INTERVAL);
+    «обычное время» берётся из недельной гистограммы стартов
+    (stream_sessions), а пока истории мало — из последних стартов;
+  • в часы, когда стример по истории не начинает, — реже (× SCHED_COLD_FACTOR);
+  • давно не стримил — реже (× SCHED_DORMANT_FACTOR);
+  • уже в эфире — реже (× SCHED_LIVE_FACTOR): конец эфира не срочен;
+  • у каждой площадки свой минимальный интервал (PLATFORM_MIN_INTERVAL).
+"""
+import heapq, random, threading, time
+from datetime import datetime
+import config
+
+Key = tuple[str, str]   # (streamer_id, platform)
+
+STARTS_KEPT = 20        # сколько последних стартов помнить на стримера
+
+
+class Scheduler:
+    def __init__(self):
+        self._heap: list[tuple[float, Key]] = []
+        self._due: dict[Key, float] = {}          # актуальное время проверки
+        self._live: dict[Key, bool] = {}
+        self._last_live: dict[Key, float] = {}    # когда последний раз был в эфире
+        self._starts: dict[str, list[float]] = {}  # время недавних стартов
+        self._hist: dict[str, list[int]] = {}      # недельная гистограмма стартов
+        self._lock = threading.Lock()
+
+    # ── Состав источников ──
+
+    def sync(self, keys, now: float | None = None):
+        """Новые источники проверить сразу, удалённые — забыть."""
+        now = time.time() if now is None else now
+        keys = set(keys)
+        with self._lock:
+            for key in keys - self._due.keys():
+                self._due[key] = now
+                self._last_live.setdefault(key, now)
+                heapq.heappush(self._heap, (now, key))
+            for key in self._due.keys() - keys:
+                del self._due[key]
+
+    def reset(self, key: Key, now: float | None = None):
+        """Источник сменился (новая ссылка): забыть его состояние и проверить сразу."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._live.pop(key, None)
+            self._last_live[key] = now
+            if key in self._due:
+                self._due[key] = now
+                heapq.heappush(self._heap, (now, key))
+
+    def pop_due(self, now: float | None = None) -> set[Key]:
+        now = time.time() if now is None else now
+        due = set()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, key = heapq.heappop(self._heap)
+                # Устаревшие записи кучи (источник удалён или перенесён) пропускаем
+                if self._due.get(key) == when:
+                    due.add(key)
+        return due
+
+    # ── Результаты ──
+
+    def record(self, key: Key, is_live: bool | None, now: float | None = None):
+        """Учесть результат проверки и назначить следующую."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if key not in self._due:
+                return
+            if is_live is not None:
+                if is_live and not self._live.get(key):
+                    starts = self._starts.setdefault(key[0], [])
+                    starts.append(now)
+                    del starts[:-STARTS_KEPT]
+                if is_live:
+                    self._last_live[key] = now
+                self._live[key] = is_live
+            when = now + self._interval(key, now)
+            self._due[key] = when
+            heapq.heappush(self._heap, (when, key))
+
+    def set_histograms(self, hist: dict[str, list[int]]):
+        """Гистограммы стартов из db.start_histograms()."""
+        with self._lock:
+            self._hist = hist
+
+    def set_last_live(self, times: dict[Key, float]):
+        """
+        Последние эфиры из db.last_live_times(). Загружать до первого
+        sync(): без истории новый источник считается недавно бывшим в
+        эфире, и после перезапуска давно молчащие опрашивались бы часто.
+        """
+        with self._lock:
+            for key, at in times.items():
+                if at > self._last_live.get(key, 0):
+                    self._last_live[key] = at
+
+    # ── Интервалы ──
+
+    def heat(self, streamer_id: str, now: float) -> bool | None:
+        """
+        True — вероятное окно начала эфира, False — в это время стример
+        по истории не начинает, None — ничего определённого.
+        """
+        hist = self._hist.get(streamer_id)
+        total = sum(hist) if hist else 0
+        if total < config.SCHED_HISTORY_MIN:
+            return True if self._near_recent_start(streamer_id, now) else None
+        t = datetime.fromtimestamp(now)
+        i = t.weekday() * 24 + t.hour
+        # Текущий час и следующий: начинать частый опрос чуть заранее
+        share = (hist[i] + hist[(i + 1) % 168]) / total
+        if share >= config.SCHED_HOT_SHARE:
+            return True
+        return False if share == 0 else None
+
+    def _near_recent_start(self, streamer_id: str, now: float) -> bool:
+        """Сейчас около времени суток одного из недавних стартов?"""
+        window = config.SCHED_HOT_WINDOW_MIN * 60
+        t = datetime.fromtimestamp(now)
+        minute = t.hour * 60 + t.minute
+        for start in self._starts.get(streamer_id, ()):
+            s = datetime.fromtimestamp(start)
+            diff = abs(minute - (s.hour * 60 + s.minute))
+            if min(diff, 24 * 60 - diff) * 60 <= window:
+                return True
+        return False
+
+    def _interval(self, key: Key, now: float) -> float:
+        base = config.CHECK_INTERVAL_SECONDS
+        min_interval = config.PLATFORM_MIN_INTERVAL.get(key[1], 0)
+        heat = self.heat(key[0], now)
+        if self._live.get(key):
+            interval = base * config.SCHED_LIVE_FACTOR
+        elif heat:
+            interval = config.SCHED_HOT_INTERVAL
+        else:
+            factor = config.SCHED_COLD_FACTOR if heat is False else 1
+            if now - self._last_live.get(key, now) > config.SCHED_DORMANT_HOURS * 3600:
+                factor = max(factor, config.SCHED_DORMANT_FACTOR)
+            interval = base * factor
+        # Небольшой разброс, чтобы проверки не сбивались в одну секунду
+        interval *= random.uniform(0.9, 1.1)
+        return max(interval, min_interval)
@@ -0,0 +1,384 @@
+"""
+standin.py — локальный стенд вместо настоящих площадок.
+Запуск: python standin.py [--port 8800] [--latency 50] [--error-rate 0.01]
+
+Отвечает на те же запросы, что делает checker.py: Helix streams и
+OAuth Twitch, RSS канала и videos/channels/playlistItems YouTube Data
+API, страницы /live YouTube, Kick channels API и страницы, VK Play
+public_video_stream и страницы, t.me/s, VK wall.get и execute.
+
+Бот направляется на стенд через config.HTTP_REWRITE_HOSTS: запрос
+https://kick.com/x приходит сюда как /kick.com/x.
+
+Любой логин на любой площадке «существует». Каждый канал сам по себе
+то выходит в эфир, то заканчивает: длительность эфира и паузы —
+экспоненциальные со средними --mean-live / --mean-offline секунд.
+Время старта отдаётся честно, так что задержку обнаружения можно
+считать по stream_sessions.
+"""
+import argparse, base64, hashlib, json, random, re, sys, threading, time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote_plus, urlsplit
+
+# Хосты, которые умеет изображать стенд
+HOSTS = [
+    "id.twitch.tv", "api.twitch.tv", "www.twitch.tv", "twitch.tv",
+    "www.youtube.com", "youtube.com", "www.googleapis.com",
+    "kick.com", "api.vkplay.live", "live.vkvideo.ru", "vkplay.live",
+    "t.me", "api.vk.com",
+]
+
+
+# ─── Мир: каналы и их эфиры ───────────────────────────────────
+
+class Channel:
+    __slots__ = ("live", "since", "starts", "next_flip")
+
+    def __init__(self, live: bool, since: float, next_flip: float):
+        self.live = live
+        self.since = since       # начало текущего эфира или паузы
+        self.starts = 0          # сколько раз выходил в эфир
+        self.next_flip = next_flip
+
+
+class World:
+    def __init__(self, mean_live: float, mean_offline: float, seed: int | None = None):
+        self.mean_live = mean_live
+        self.mean_offline = mean_offline
+        self.rand = random.Random(seed)
+        self.channels: dict[tuple[str, str], Channel] = {}
+        self.videos: dict[str, tuple[str, int]] = {}   # id ролика → (канал, № эфира)
+        self.lock = threading.Lock()
+
+    def channel(self, platform: str, name: str, now: float | None = None) -> Channel:
+        """Канал в состоянии на момент now (смены состояния догоняются лениво)."""
+        now = time.time() if now is None else now
+        key = (platform, name.lower())
+        with self.lock:
+            ch = self.channels.get(key)
+            if ch is None:
+                share = self.mean_live / (self.mean_live + self.mean_offline)
+                live = self.rand.random() < share
+                mean = self.mean_live if live else self.mean_offline
+                ch = self.channels[key] = Channel(
+                    live, now - self.rand.random() * mean,
+                    now + self.rand.expovariate(1 / mean))
+                ch.starts = int(live)
+            while now >= ch.next_flip:
+                ch.live = not ch.live
+                ch.since = ch.next_flip
+                ch.starts += ch.live
+                mean = self.mean_live if ch.live else self.mean_offline
+                ch.next_flip += self.rand.expovariate(1 / mean)
+            return ch
+
+    def video_id(self, name: str, start: int) -> str:
+        digest = hashlib.sha1(f"{name}:{start}".encode()).digest()
+        vid = base64.urlsafe_b64encode(digest).decode()[:11]
+        with self.lock:
+            self.videos[vid] = (name.lower(), start)
+        return vid
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _clock(seconds: float) -> str:
+    s = int(max(seconds, 0))
+    return f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+
+# ─── Ответы площадок ──────────────────────────────────────────
+#
+# Обработчик получает (world, path, query, body) и возвращает
+# (status, content_type, тело, etag | None).
+
+JSON, HTML, XML = "application/json", "text/html; charset=utf-8", "application/xml"
+
+def _json(data) -> tuple:
+    return 200, JSON, json.dumps(data, ensure_ascii=False), None
+
+def _page(ch: Channel, name: str, body: str) -> tuple:
+    # ETag меняется со сменой состояния — бот получает 304 на неизменное
+    return (200, HTML,
+            f"<!DOCTYPE html><html><head><title>{name}</title></head><body>{body}</body></html>",
+            f'"{name}-{ch.starts}-{int(ch.live)}"')
+
+def twitch_token(world, path, query, body):
+    return _json({"access_token": "standin", "expires_in": 5_000_000, "token_type": "bearer"})
+
+def twitch_streams(world, path, query, body):
+    data = []
+    for login in query.get("user_login", []):
+        ch = world.channel("twitch", login)
+        if ch.live:
+            data.append({"id": f"{login}-{ch.starts}", "user_login": login.lower(),
+                         "type": "live", "title": f"{login} в эфире",
+                         "viewer_count": 100, "started_at": _iso(ch.since)})
+    return _json({"data": data, "pagination": {}})
+
+def twitch_page(world, path, query, body):
+    name = path.strip("/").split("/")[0]
+    ch = world.channel("twitch", name)
+    marker = '<script type="application/ld+json">{"isLiveBroadcast":true}</script>' if ch.live else ""
+    return _page(ch, name, marker + "<div>Twitch</div>")
+
+def _yt_name(ch_id: str) -> str:
+    return ch_id[2:].rstrip("_")
+
+def youtube_feed(world, path, query, body):
+    ch_id = query.get("channel_id", [""])[0]
+    name = _yt_name(ch_id)
+    ch = world.channel("youtube", name)
+    last = ch.starts
+    entries = "".join(f"<entry><yt:videoId>{world.video_id(name, n)}</yt:videoId></entry>"
+                      for n in range(last, max(last - 5, 0), -1))
+    return 200, XML, f'<?xml version="1.0"?><feed xmlns:yt="http://www.youtube.com/xml/schemas/2015">{entries}</feed>', None
+
+def youtube_api(world, path, query, body):
+    method = path.rstrip("/").rsplit("/", 1)[-1]
+    if method == "videos":
+        items = []
+        for vid in ",".join(query.get("id", [])).split(","):
+            with world.lock:
+                owner = world.videos.get(vid)
+            if not owner:
+                continue
+            name, start = owner
+            ch = world.channel("youtube", name)
+            live = ch.live and ch.starts == start
+            item = {"id": vid, "snippet": {"title": f"{name} #{start}",
+                                           "liveBroadcastContent": "live" if live else "none"}}
+            if live:
+                item["liveStreamingDetails"] = {"actualStartTime": _iso(ch.since),
+                                                "concurrentViewers": "100"}
+            items.append(item)
+        return _json({"items": items})
+    if method == "channels":
+        handle = (query.get("forHandle") or query.get("forUsername") or [""])[0].lstrip("@")
+        return _json({"items": [{"id": f"UC{handle:_<22}"[:24]}]})
+    if method == "playlistItems":
+        name = _yt_name("UC" + query.get("playlistId", ["UU"])[0][2:])
+        ch = world.channel("youtube", name)
+        return _json({"items": [{"contentDetails": {"videoId": world.video_id(name, ch.starts)}}]})
+    return 404, JSON, '{"error": {"message": "unknown method"}}', None
+
+def youtube_page(world, path, query, body):
+    parts = [p for p in path.strip("/").split("/") if p not in ("live", "channel")]
+    name = parts[-1].lstrip("@") if parts else ""
+    if name.startswith("UC"):
+        name = _yt_name(name)
+    ch = world.channel("youtube", name)
+    marker = '"liveBroadcastContent":"live"' if ch.live else '"liveBroadcastContent":"none"'
+    return _page(ch, name, f'<script>var ytInitialData={{{marker}}};</script>'
+                           f'<link itemprop="url" href="https://www.youtube.com/channel/UC{name:_<22}"/>')
+
+def kick_api(world, path, query, body):
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+    ch = world.channel("kick", name)
+    stream = None
+    if ch.live:
+        stream = {"id": ch.starts, "session_title": f"{name} в эфире", "is_live": True,
+                  "start_time": _iso(ch.since).replace("T", " ").rstrip("Z"),
+                  "viewer_count": 100}
+    return _json({"slug": name, "livestream": stream})
+
+def kick_page(world, path, query, body):
+    name = path.strip("/").split("/")[0]
+    ch = world.channel("kick", name)
+    live = (f'<div class="bg-green-500">LIVE</div>'
+            f'<span class="text-sm tabular-nums">{_clock(time.time() - ch.since)}</span>') if ch.live else ""
+    return _page(ch, name, live)
+
+def vkplay_api(world, path, query, body):
+    name = path.strip("/").split("/")[2]   # v1/blog/<name>/public_video_stream
+    ch = world.channel("vkplay", name)
+    item = {"id": f"{name}-{ch.starts}", "isOnline": ch.live, "title": f"{name} в эфире"}
+    if ch.live:
+        item.update(startTime=int(ch.since), count={"viewers": 100})
+    return _json({"data": [item]})
+
+def vkplay_page(world, path, query, body):
+    name = path.strip("/").split("/")[0]
+    ch = world.channel("vkplay", name)
+    live = (f'<div class="StreamStatus_isOnline_x1">В эфире</div>'
+            f'<div class="ChannelStreamPanel_timer_x1">{_clock(time.time() - ch.since)}</div>') if ch.live else ""
+    return _page(ch, name, live)
+
+def _feed_posts(ch: Channel, name: str) -> list[tuple[int, float, str]]:
+    """Последние посты ленты: анонс на каждый старт + пост после эфира."""
+    posts = []
+    for n in range(max(ch.starts - 2, 1), ch.starts + 1):
+        posts.append((100 + 2 * n, ch.since if n == ch.starts and ch.live else ch.since - 3600,
+                      f"Начинаю стрим! https://twitch.tv/{name}"))
+        if n < ch.starts or not ch.live:
+            posts.append((101 + 2 * n, ch.since if not ch.live else ch.since - 60,
+                          "Спасибо всем, кто был на эфире"))
+    return posts
+
+def telegram_page(world, path, query, body):
+    name = path.strip("/").split("/")[-1]
+    ch = world.channel("telegram", name)
+    html = "".join(
+        f'<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+        f'<div class="tgme_widget_message" data-post="{name}/{pid}">'
+        f'<div class="tgme_widget_message_text">{text}</div>'
+        f'<time datetime="{_iso(when)}"></time></div></div>'
+        for pid, when, text in _feed_posts(ch, name))
+    return _page(ch, name, f'<section class="tgme_channel_history">{html}</section>')
+
+def _vk_wall(world, domain: str) -> dict:
+    ch = world.channel("vk_group", domain)
+    items = [{"id": pid, "date": int(when), "text": text, "attachments": []}
+             for pid, when, text in reversed(_feed_posts(ch, domain))]
+    return {"count": len(items), "items": items}
+
+_EXECUTE_DOMAIN_RE = re.compile(r'"domain":"([^"]+)"')
+
+def vk_api(world, path, query, body):
+    method = path.rstrip("/").rsplit("/", 1)[-1]
+    if method == "wall.get":
+        return _json({"response": _vk_wall(world, query.get("domain", [""])[0])})
+    if method == "execute":
+        code = parse_qs(body).get("code", [""])[0]
+        return _json({"response": [_vk_wall(world, d)
+                                   for d in _EXECUTE_DOMAIN_RE.findall(code)]})
+    return _json({"error": {"error_code": 3, "error_msg": "Unknown method"}})
+
+# (хост, регулярка пути) → обработчик; первый совпавший
+ROUTES = [
+    ("id.twitch.tv",       r"/oauth2/token",                 twitch_token),
+    ("api.twitch.tv",      r"/helix/streams",                twitch_streams),
+    ("www.twitch.tv",      r"/[^/]+",                        twitch_page),
+    ("twitch.tv",          r"/[^/]+",                        twitch_page),
+    ("www.youtube.com",    r"/feeds/videos\.xml",            youtube_feed),
+    ("www.googleapis.com", r"/youtube/v3/\w+",               youtube_api),
+    ("www.youtube.com",    r"/.+",                           youtube_page),
+    ("youtube.com",        r"/.+",                           youtube_page),
+    ("kick.com",           r"/api/v1/channels/[^/]+",        kick_api),
+    ("kick.com",           r"/[^/]+",                        kick_page),
+    ("api.vkplay.live",    r"/v1/blog/[^/]+/public_video_stream", vkplay_api),
+    ("live.vkvideo.ru",    r"/[^/]+",                        vkplay_page),
+    ("vkplay.live",        r"/[^/]+",                        vkplay_page),
+    ("t.me",               r"/s/[^/]+",                      telegram_page),
+    ("api.vk.com",         r"/method/[\w.]+",                vk_api),
+]
+ROUTES = [(host, re.compile(pattern + r"/?$"), fn) for host, pattern, fn in ROUTES]
+
+
+# ─── HTTP-сервер ──────────────────────────────────────────────
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, addr, world: World, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(addr, _Handler)
+        self.world = world
+        self.latency = latency          # средняя задержка ответа, сек
+        self.error_rate = error_rate    # доля ответов 503
+        self.requests = 0
+        self.by_host: dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rewrite_map(self) -> dict[str, str]:
+        """Готовое значение для config.HTTP_REWRITE_HOSTS."""
+        return {host: self.base_url for host in HOSTS}
+
+    def handle_error(self, request, client_address):
+        # Клиент не дождался ответа (таймаут проверки) и закрыл
+        # соединение — для стенда это норма, трассировка только мешает отчёту
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._handle(self.rfile.read(length).decode("utf-8", "replace"))
+
+    def _handle(self, body: str):
+        server: StandIn = self.server
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        path = "/" + unquote_plus(path)
+        query = parse_qs(parts.query)
+        if self.command == "POST" and not query:
+            query = parse_qs(body)
+        with server._stats_lock:
+            server.requests += 1
+            server.by_host[host] = server.by_host.get(host, 0) + 1
+
+        if server.latency:
+            time.sleep(server.world.rand.uniform(0.5, 1.5) * server.latency)
+        if server.error_rate and server.world.rand.random() < server.error_rate:
+            return self._send(503, "text/plain", "Service Unavailable")
+        for route_host, pattern, fn in ROUTES:
+            if route_host == host and pattern.match(path):
+                status, ctype, text, etag = fn(server.world, path, query, body)
+                if etag and etag == self.headers.get("If-None-Match"):
+                    return self._send(304, ctype, "", etag)
+                return self._send(status, ctype, text, etag)
+        self._send(404, JSON, '{"error": "not found"}')
+
+    def _send(self, status: int, ctype: str, text: str, etag: str | None = None):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+
+def start(port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+          mean_live: float = 3600, mean_offline: float = 7200,
+          seed: int | None = None) -> StandIn:
+    """Запустить стенд в фоновом потоке (port=0 — любой свободный)."""
+    server = StandIn(("127.0.0.1", port), World(mean_live, mean_offline, seed),
+                     latency, error_rate)
+    threading.Thread(target=server.serve_forever, name="standin", daemon=True).start()
+    return server
+
+
+def run():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--latency", type=float, default=0, help="средняя задержка ответа, мс")
+    ap.add_argument("--error-rate", type=float, default=0, help="доля ответов 503 (0..1)")
+    ap.add_argument("--mean-live", type=float, default=3600, help="средняя длина эфира, сек")
+    ap.add_argument("--mean-offline", type=float, default=7200, help="средняя пауза, сек")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    server = start(args.port, args.latency / 1000, args.error_rate,
+                   args.mean_live, args.mean_offline, args.seed)
+    print(f"Стенд слушает {server.base_url}")
+    print("В config.py:")
+    print(f"HTTP_REWRITE_HOSTS = {json.dumps(server.rewrite_map(), indent=4)}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"запросов: {server.requests}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    run()
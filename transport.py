@@ -0,0 +1,333 @@
+"""
+transport.py — общий HTTP-транспорт для всех исходящих запросов:
+проверки площадок, OAuth, VK API.
+
+  • пулы keep-alive соединений по хостам, размером под параллельность;
+  • отдельные таймауты на соединение и на чтение;
+  • ограниченные повторы с джиттером для GET;
+  • срок (deadline) на всю операцию: таймауты и повторы в него укладываются;
+  • дублирование медленных запросов к API (Session.get_hedged);
+  • хуки с временем каждого запроса (метрики, статистика);
+  • кэш HTML-страниц с условными запросами (CachedSession.get_cached).
+"""
+import logging, random, threading, time
+from collections import OrderedDict, deque
+from concurrent.futures import (ThreadPoolExecutor, FIRST_COMPLETED,
+                                TimeoutError as FutureTimeout, wait)
+from contextlib import contextmanager
+from urllib.parse import urlparse, urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import config
+
+log = logging.getLogger(__name__)
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/122.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "ru-RU,ru;q=0.9",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+# Статусы, после которых GET имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_METHODS = {"GET", "HEAD"}
+
+# Хуки вызываются после каждого запроса:
+#   hook(method, host, status | None, elapsed_sec, error | None)
+hooks: list = []
+
+def add_hook(fn):
+    hooks.append(fn)
+
+
+# ─── Срок операции ────────────────────────────────────────────
+#
+# Срок задаётся на поток: все запросы внутри `with deadline(...)`
+# сокращают таймауты до оставшегося времени и не повторяются,
+# если пауза перед повтором в срок не влезает.
+
+_local = threading.local()
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Срок операции вышел раньше, чем ответил хост: площадка тут ни при чём."""
+
+
+@contextmanager
+def deadline(at: float | None):
+    """at — time.monotonic(), к которому всё должно закончиться (None — без срока)."""
+    prev = getattr(_local, "deadline", None)
+    _local.deadline = at
+    try:
+        yield
+    finally:
+        _local.deadline = prev
+
+def current_deadline() -> float | None:
+    """Срок текущего потока — чтобы передать его в задачи другого пула."""
+    return getattr(_local, "deadline", None)
+
+def sent() -> int:
+    """Сколько запросов текущий поток отправил в сеть (ответы из кэша не в счёт)."""
+    return getattr(_local, "sent", 0)
+
+def _count_sent():
+    _local.sent = sent() + 1
+
+def _remaining() -> float | None:
+    at = getattr(_local, "deadline", None)
+    return None if at is None else at - time.monotonic()
+
+
+# ─── Задержки хостов ──────────────────────────────────────────
+
+_latency: dict[str, deque] = {}
+_latency_lock = threading.Lock()
+
+def _observe(host: str, elapsed: float):
+    with _latency_lock:
+        samples = _latency.get(host)
+        if samples is None:
+            samples = _latency[host] = deque(maxlen=config.HTTP_HEDGE_WINDOW)
+        samples.append(elapsed)
+
+def _hedge_delay(host: str) -> float | None:
+    """Через сколько секунд дублировать запрос к host (None — не дублировать)."""
+    with _latency_lock:
+        samples = sorted(_latency.get(host, ()))
+    if len(samples) < config.HTTP_HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(int(len(samples) * config.HTTP_HEDGE_PERCENTILE),
+                       len(samples) - 1)]
+
+# Дублирующие запросы идут из своего пула: поток проверки только ждёт
+_hedge_pool = ThreadPoolExecutor(max_workers=config.CHECK_WORKERS * 2,
+                                 thread_name_prefix="hedge")
+
+
+class Session(requests.Session):
+    """
+    requests.Session с общими для бота настройками транспорта.
+    Число в timeout — таймаут чтения; соединение всегда ждём
+    HTTP_CONNECT_TIMEOUT.
+    """
+
+    def __init__(self, headers: dict | None = None):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_HOSTS,
+                              pool_maxsize=config.CHECK_WORKERS)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        if headers:
+            self.headers.update(headers)
+
+    def request(self, method, url, *args, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = config.HTTP_READ_TIMEOUT
+        if not isinstance(timeout, tuple):
+            timeout = (config.HTTP_CONNECT_TIMEOUT, timeout)
+        retries = config.HTTP_RETRIES if method.upper() in RETRY_METHODS else 0
+        host = urlparse(url).hostname or ""
+        if config.HTTP_REWRITE_HOSTS:
+            url = _rewrite(url)
+        for attempt in range(retries + 1):
+            left = _remaining()
+            cut = False
+            if left is not None:
+                if left <= 0:
+                    raise DeadlineExceeded(f"deadline exceeded: {url}")
+                cut = left < max(timeout)
+                timeout = (min(timeout[0], left), min(timeout[1], left))
+            _count_sent()
+            started = time.monotonic()
+            try:
+                r = super().request(method, url, *args, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                _run_hooks(method, host, None, time.monotonic() - started, e)
+                if cut and isinstance(e, requests.Timeout):
+                    # Таймаут, урезанный сроком: не дождались мы, а не хост не ответил
+                    raise DeadlineExceeded(f"deadline exceeded: {url}") from e
+                if attempt >= retries or not _backoff(attempt, None):
+                    raise
+                continue
+            elapsed = time.monotonic() - started
+            _run_hooks(method, host, r.status_code, elapsed, None)
+            if r.status_code < 500:
+                _observe(host, elapsed)
+            if (r.status_code not in RETRY_STATUSES or attempt >= retries
+                    or not _backoff(attempt, r.headers.get("Retry-After"))):
+                return r
+        return r
+
+    def get_hedged(self, url, **kwargs) -> requests.Response:
+        """
+        GET, который дублируется, если ответа нет дольше обычного
+        (HTTP_HEDGE_PERCENTILE задержек этого хоста). Возвращается
+        первый успешный ответ; опоздавший просто отбрасывается.
+        Только для идемпотентных запросов к API.
+        """
+        delay = _hedge_delay(urlparse(url).hostname or "")
+        if delay is None:
+            return self.get(url, **kwargs)
+        at = current_deadline()
+        _count_sent()   # сами запросы уйдут из потоков _hedge_pool
+
+        def call():
+            with deadline(at):
+                return self.get(url, **kwargs)
+
+        first = _hedge_pool.submit(call)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        second = _hedge_pool.submit(call)
+        done, _ = wait((first, second), return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is None:
+            return winner.result()
+        return (second if winner is first else first).result()
+
+
+def _rewrite(url: str) -> str:
+    """URL на стенд вместо настоящей площадки (config.HTTP_REWRITE_HOSTS)."""
+    parts = urlsplit(url)
+    base = config.HTTP_REWRITE_HOSTS.get(parts.hostname or "")
+    if not base:
+        return url
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{base.rstrip('/')}/{parts.hostname}{parts.path}{query}"
+
+
+def raise_for_outage(r: requests.Response):
+    """Ошибка, если площадка сама сломана (5xx) или ограничивает нас (429)."""
+    if r.status_code >= 500 or r.status_code == 429:
+        raise requests.HTTPError(f"{r.status_code} {r.url}", response=r)
+
+
+def _run_hooks(method, host, status, elapsed, error):
+    for hook in hooks:
+        try:
+            hook(method, host, status, elapsed, error)
+        except Exception as e:
+            log.debug("transport hook: %s", e)
+
+def _backoff(attempt: int, retry_after: str | None) -> bool:
+    """
+    Экспоненциальная пауза с полным джиттером (не дольше HTTP_RETRY_MAX_SLEEP).
+    False — пауза не укладывается в срок, повторять не надо.
+    """
+    delay = random.uniform(0, config.HTTP_RETRY_BACKOFF * 2 ** attempt)
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    delay = min(delay, config.HTTP_RETRY_MAX_SLEEP)
+    left = _remaining()
+    if left is not None and delay >= left:
+        return False
+    time.sleep(delay)
+    return True
+
+
+# ─── HTTP-кэш ──────────────────────────────────────────────────
+
+class _CacheEntry:
+    __slots__ = ("text", "etag", "last_modified", "fetched_at", "parsed")
+
+    def __init__(self, text: str, etag: str | None, last_modified: str | None):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+        self.parsed: dict = {}
+
+
+class CachedSession(Session):
+    """
+    requests.Session с кэшем страниц для get_cached():
+      • пока страница свежее TTL — запроса нет вовсе (проверка и
+        длительность в одном цикле делят один ответ);
+      • дальше — условный запрос с If-None-Match / If-Modified-Since,
+        на 304 остаётся и тело, и уже разобранный результат.
+    Обычные get()/post() работают как раньше, без кэша.
+    """
+
+    def __init__(self, max_bytes: int, headers: dict | None = None):
+        super().__init__(headers)
+        self.max_bytes = max_bytes
+        self._cache: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def ttl_for(url: str) -> float:
+        host = urlparse(url).hostname or ""
+        return config.HTTP_CACHE_TTL.get(host.removeprefix("www."),
+                                         config.HTTP_CACHE_TTL_DEFAULT)
+
+    def get_cached(self, url: str, parse=None, ttl: float | None = None,
+                   timeout: float = 15):
+        """
+        Тело страницы или parse(тело). parse — функция уровня модуля:
+        её результат кэшируется вместе со страницей до её изменения.
+        """
+        if ttl is None:
+            ttl = self.ttl_for(url)
+        with self._cache_lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+        if entry is None or time.monotonic() - entry.fetched_at >= ttl:
+            entry = self._revalidate(url, entry, timeout)
+        if parse is None:
+            return entry.text
+        with self._cache_lock:
+            if parse in entry.parsed:
+                return entry.parsed[parse]
+        value = parse(entry.text)
+        with self._cache_lock:
+            entry.parsed[parse] = value
+        return value
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def _revalidate(self, url: str, entry: _CacheEntry | None,
+                    timeout: float) -> _CacheEntry:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        r = self.get(url, headers=headers, timeout=timeout)
+        raise_for_outage(r)
+        if r.status_code == 304 and entry is not None:
+            entry.fetched_at = time.monotonic()
+            return entry
+        fresh = _CacheEntry(r.text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        if r.status_code != 200:
+            return fresh   # ошибки и редиректы на заглушки не кэшируем
+        with self._cache_lock:
+            old = self._cache.pop(url, None)
+            if old is not None:
+                self._cache_bytes -= len(old.text)
+            self._cache[url] = fresh
+            self._cache_bytes += len(fresh.text)
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.text)
+        return fresh
+
+
+# Сессия проверок площадок. Для VK API — отдельная (vk_session()),
+# чтобы vk_api не делил заголовки браузера со скрапингом.
+session = CachedSession(config.HTTP_CACHE_MAX_MB * 1024 * 1024, HEADERS)
+
+def vk_session() -> Session:
+    return Session()